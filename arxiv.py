@@ -1,66 +1,108 @@
 import argparse
 import datetime
+import itertools
 import os
 import os.path as path
-import time
+import re
 import webbrowser
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator
 
-import markdown
+from rich.progress import Progress
 
 import arxivcategory
+import backfill
+import daemon
 import db
+import fetchcache
+import httpclient
+import render
+import serve
+import sitebuild
 import translators
 import utils
-from arxivdata import ATOMItem, parse_atom, parse_rss_new
-from arxivquery import query_atom, query_rss
-from config import CACHE_GEN
+import venue
+import watchlist
+from arxivdata import ATOMItem, merge_rss_meta, parse_atom, parse_rss_new
+from arxivquery import query_atom, query_rss_many
+from config import CACHE_GEN, WATCHLIST_PATH
 from db import MainLogItem, TransItem
 from utils import logger
 
 
-def translate(atom_item: ATOMItem, tr_option: tuple[bool, bool], force=False, delay=0.5) -> tuple[bool, bool]:
+def translate(atom_items: list[ATOMItem], tr_option: tuple[bool, bool], force=False,
+              service="google", workers=4,
+              trans_cache: dict[str, TransItem] | None = None) -> dict[str, tuple[str | None, str | None]]:
+    # requests run in the pool, db writes stay on this thread (sqlite conn is not shared).
+    # `trans_cache` holds translations already loaded with the papers, skipping the db lookups
     if not tr_option[0] and not tr_option[1]:
-        return (None, None)
-    _title = 'Title' if tr_option[0] else ''
-    _abs = 'Abstract' if tr_option[1] else ''
-    logger.debug("Translating %s%s for %s", _title, _abs, atom_item.arxivid)
-    trans_cache = db.translation_get(atom_item.arxivid)
-    if trans_cache is None:
-        trans_cache = TransItem(atom_item.arxivid, None, None)
-    if tr_option[0] and (trans_cache.title is None or force):
-        trans_cache.title = translators.translate(atom_item.title)
-        if trans_cache.title is None or len(trans_cache.title) == 0:
-            db.conn.commit()
-            raise Exception
-        else:
-            db.translation_set(trans_cache)
-        time.sleep(delay)
-    if tr_option[1] and (trans_cache.abs is None or force):
-        summary = utils.pre_process_abstract(atom_item.summary)
-        trans_cache.abs = translators.translate(summary)
-        if trans_cache.abs is None or len(trans_cache.abs) == 0:
-            db.conn.commit()
-            raise Exception
+        return {item.arxivid: (None, None) for item in atom_items}
+    trans_items: dict[str, TransItem] = dict()
+    jobs: list[tuple[str, str, str]] = list()
+    for atom_item in atom_items:
+        if trans_cache is None:
+            trans_item = db.translation_get(atom_item.arxivid)
         else:
-            db.translation_set(trans_cache)
-        time.sleep(delay)
-    db.conn.commit()
-    return trans_cache.title, trans_cache.abs
+            trans_item = trans_cache.get(atom_item.arxivid)
+        if trans_item is None:
+            trans_item = TransItem(atom_item.arxivid, None, None)
+        trans_items[atom_item.arxivid] = trans_item
+        if tr_option[0] and (trans_item.title is None or force):
+            jobs.append((atom_item.arxivid, "title", atom_item.title_clean))
+        if tr_option[1] and (trans_item.abs is None or force):
+            jobs.append((atom_item.arxivid, "abs", atom_item.summary_clean))
+    texts = [text for _, _, text in jobs]
+    chunks = translators.chunk(texts, service)
+    logger.info("Translating %d texts in %d requests with %s (%d workers)",
+                len(jobs), len(chunks), service, workers)
+
+    failed = list()
+    with ThreadPoolExecutor(max_workers=workers) as pool, Progress() as _progress:
+        _task = _progress.add_task("[blue]Translating...", total=len(jobs))
+        futures = {pool.submit(translators.translate_many, [texts[i] for i in idx], service): idx
+                   for idx in chunks}
+        for future in as_completed(futures):
+            idx = futures[future]
+            _progress.update(_task, advance=len(idx))
+            try:
+                results = future.result()
+            except Exception as err:
+                logger.error("Translation request failed: %s", err)
+                results = [None] * len(idx)
+            updated = dict()
+            for i, result in zip(idx, results):
+                arxivid, field, _ = jobs[i]
+                if result is None or len(result) == 0:
+                    failed.append(arxivid)
+                    continue
+                updated[arxivid] = trans_items[arxivid]
+                setattr(updated[arxivid], field, result)
+            db.translation_set_many(updated.values(), force=True)
+    if len(failed) != 0:
+        raise Exception(f"Translation failed for {', '.join(sorted(set(failed)))}")
+    return {arxivid: (item.title, item.abs) for arxivid, item in trans_items.items()}
 
 
-def ATOM2MD(metadata: ATOMItem, translations: tuple[str | None, str | None] = (None, None)) -> str:
+def ATOM2MD(metadata: ATOMItem, translations: tuple[str | None, str | None] = (None, None),
+            watch: watchlist.Watchlist | None = None) -> str:
     tr_title, tr_abs = translations
     tr_title = tr_title or "这是标题"
     tr_abs = tr_abs or "这是摘要"
+    venue_line = f"> Venue: **{metadata.venue}** (CCF-{metadata.venue_rank})  \n" if metadata.venue else ""
+    relevance_line = ""
+    if metadata.relevance > 0:
+        relevance_line = f"> Relevance: **{metadata.relevance:g}** ({', '.join(metadata.watch_hits)})  \n"
+    title = watchlist.highlight(watch, metadata.title_clean, lambda text: f"**{text}**", str)
+    abstract = watchlist.highlight(watch, metadata.summary_clean, lambda text: f"**{text}**", str)
 
     return f"""\
-### {metadata.title}
+### {title}
 
 > **{tr_title}**  
 > Link: [{metadata.arxivid}]({metadata.link_abs})  
 > Comments: {metadata.comment}  
-> Category: **{metadata.primary_category}**, {", ".join(metadata.category)}  
+{venue_line}{relevance_line}> Category: **{metadata.primary_category}**, {", ".join(metadata.category)}  
 > Authors: {", ".join(metadata.author)}  
 > Date: {metadata.updated}{f" (Published @{metadata.published})" if metadata.is_update() else ""}  
 
@@ -70,12 +112,12 @@ def ATOM2MD(metadata: ATOMItem, translations: tuple[str | None, str | None] = (N
 
 **Abstract:**
 
-{utils.pre_process_abstract(metadata.summary)}
+{abstract}
 
 """
 
 
-def generate_markdown(cate2item, skip2item, tag, pubtime, fetchtime) -> str:
+def generate_markdown(cate2item, skip2item, translations, tag, pubtime, fetchtime, watch=None) -> str:
     import io
     f = io.StringIO()
     f.write(f"""\
@@ -84,7 +126,6 @@ def generate_markdown(cate2item, skip2item, tag, pubtime, fetchtime) -> str:
 > Fetched @ {fetchtime}
 
 """)
-    from rich.progress import Progress
     _progress_total = sum([len(cate2item[cate]) for cate in cate2item])
     with Progress() as _progress:
         _task = _progress.add_task("[blue]Generating MD...", total=_progress_total)
@@ -92,9 +133,7 @@ def generate_markdown(cate2item, skip2item, tag, pubtime, fetchtime) -> str:
             f.write(
                 f"""## {cate}, {arxivcategory.ALL_CATEGORY[cate]}\n> {len(cate2item[cate])} papers today\n""")
             for item in cate2item[cate]:
-                translations = translate(
-                    item, (args.translate_title, args.translate_abs), args.translate_force)
-                f.write(ATOM2MD(item, translations))
+                f.write(ATOM2MD(item, translations[item.arxivid], watch))
                 _progress.update(_task, advance=1)
     for cate in skip2item:
         skips = [item.arxivid for item in skip2item[cate]]
@@ -104,76 +143,107 @@ def generate_markdown(cate2item, skip2item, tag, pubtime, fetchtime) -> str:
     return result
 
 
-def generate_from_history(date: str, args) -> tuple[list[ATOMItem], str]:
-    logger.info(f"Retrieving paper back in {date} from database")
-    arxivtime = datetime.datetime.strptime(date, "%Y%m%d")
-    arxivtime = arxivtime.replace(hour=20, minute=30, tzinfo=utils._arxiv_tz).isoformat()
-    id_lists = db.daily_get_by_date(arxivtime)
-    atom_items = []
-    for arxivid in id_lists:
-        meta_item = db.paper_meta_get(arxivid)
-        if meta_item is None:
-            logger.error(f"record not found {arxivid}")
-            continue
-        atom_items.append(meta_item)
-    return atom_items, arxivtime
+def parse_history(history: str) -> tuple[str, str]:
+    # `20240101` or `20240101..20240131`, both ends inclusive, dates in arxiv's timezone
+    first, _, last = history.partition("..")
+    start = datetime.datetime.strptime(first, "%Y%m%d").date()
+    end = datetime.datetime.strptime(last or first, "%Y%m%d").date() + datetime.timedelta(days=1)
+    return start.isoformat(), end.isoformat()
+
 
+def generate_from_history(history: str, collection: str,
+                          args) -> Iterator[tuple[str, list[ATOMItem], dict[str, TransItem]]]:
+    logger.info(f"Retrieving paper back in {history} from database")
+    start, end = parse_history(history)
+    records = db.history_iter(start, end, arxivcategory.COLLECTIONS[collection])
+    # one feed per announcement date, however its rows were keyed
+    for date, day_records in itertools.groupby(records, key=lambda record: record[0][:10]):
+        atom_items = []
+        trans_cache = dict()
+        for _, atom_item, trans_item in day_records:
+            atom_items.append(atom_item)
+            if trans_item is not None:
+                trans_cache[atom_item.arxivid] = trans_item
+        yield utils.get_arxiv_day(datetime.date.fromisoformat(date)), atom_items, trans_cache
 
-def generate_from_query(cate_list: list[str], args) -> tuple[list[ATOMItem], str]:
+
+def generate_from_query(cate_list: list[str], args) -> tuple[list[ATOMItem], str, dict[str, list[str]]]:
     logger.info(f"Querying RSS for Category: {cate_list}")
-    id_list = list()
     rss_metas = dict()
-    for cate in cate_list:
-        rss_str = query_rss(cate, args.refetch)
+    changed = set()
+    id2cate: dict[str, list[str]] = defaultdict(list)
+    for chunk, rss_str in query_rss_many(cate_list, args.refetch):
         rss_meta, rss_items = parse_rss_new(rss_str)
-        rss_metas[cate] = rss_meta
-        id_list += [item.arxivid for item in rss_items]
-    id_list = sorted(list(set(id_list)), reverse=True)
-
-    logger.info(f"Collecting details for {len(id_list)} papers")
-    atom_strs = query_atom(id_list, items_per_req=40, force=args.refetch)
-    atom_items: list[ATOMItem] = []
-    for atom_str in atom_strs:
-        atom_items += parse_atom(atom_str)
-    logger.info(f"Flushing data to db")
-    for atom_item in atom_items:
-        db.daily_set(MainLogItem(atom_item.arxivid, rss_meta.pubDate, None))
-        db.paper_meta_set(atom_item)
-    db.conn.commit()
-    return atom_items, rss_meta.pubDate
-
-def generate_html(markdown_text : str, args, style_link: str) -> str:
-    md = markdown.Markdown(extensions=["toc"])
-    content = md.convert(markdown_text)
-    prelude = f"""
-<!DOCTYPE html>
-<html>
-  <head>
-    <meta charset="UTF-8">
-    <title>Arxiv Feed for {args.collection}</title>
-    <link type="text/css" rel="stylesheet" href="{style_link}">
-  </head>
-  <body>
-"""
-    content = f"""
-      <div id="write">
-      {content}
-      </div>
-"""
-    postlude = f"""
-    </div>
-  </body>
-</html>
-"""
-    return "".join([prelude, md.toc, content, postlude])
+        rss_metas["+".join(chunk)] = rss_meta
+        untagged = []
+        for item in rss_items:
+            # a combined feed lists each paper once; its <category> tags tell which of ours it belongs to.
+            # only a single category feed can vouch for a paper without a matching tag
+            cates = [cate for cate in chunk if cate in item.category] or (chunk if len(chunk) == 1 else [])
+            if len(cates) == 0:
+                untagged.append(item.arxivid)
+            for cate in cates:
+                if cate not in id2cate[item.arxivid]:
+                    id2cate[item.arxivid].append(cate)
+        if len(untagged) != 0:
+            logger.warning("%d papers in the %s feed carry none of its categories, skipped: %s",
+                           len(untagged), "+".join(chunk), ", ".join(untagged))
+        changed.update(item.arxivid for item in rss_items if item.announcetype.startswith("replace"))
+    rss_meta = merge_rss_meta(rss_metas)
+    arxivtime = utils.get_arxiv_day(rss_meta.pubDate)
+    id_list = sorted(id2cate.keys(), reverse=True)
 
-def generate(args):
-    cate_list: list[str] = arxivcategory.COLLECTIONS[args.collection]
-    db.init_db()
-    if args.history is not None:
-        atom_items, arxivtime = generate_from_history(args.history, args)
+    # only ask the API for papers we do not have, or that were replaced since we logged them
+    stored = db.paper_meta_existing(id_list)
+    stale = (changed & stored) - db.daily_logged(arxivtime, list(changed & stored))
+    fetch_list = [arxivid for arxivid in id_list
+                  if arxivid not in stored or arxivid in stale or args.refetch]
+    logger.info(f"Collecting details for {len(id_list)} papers, {len(fetch_list)} to fetch")
+    # page N is parsed and written while page N+1 is being downloaded
+    fetched_items: list[ATOMItem] = []
+    # replaced papers bypass the fetch cache, their cached entry is the old version
+    atom_pages = query_atom(fetch_list, items_per_req=40, force=args.refetch, force_ids=stale)
+    for atom_str in utils.prefetch(atom_pages):
+        page_items = parse_atom(atom_str)
+        db.paper_meta_set_many(page_items, force=True)
+        fetched_items += page_items
+    fetched_ids = set(item.arxivid for item in fetched_items)
+    stored_items = db.paper_meta_get_many([arxivid for arxivid in id_list if arxivid not in fetched_ids])
+
+    atom_items = fetched_items + stored_items
+    order = {arxivid: idx for idx, arxivid in enumerate(id_list)}
+    atom_items.sort(key=lambda item: order.get(item.arxivid, len(order)))
+    db.daily_set_many(MainLogItem(atom_item.arxivid, arxivtime, cate)
+                      for atom_item in atom_items for cate in id2cate[atom_item.arxivid])
+    return atom_items, arxivtime, id2cate
+
+
+def generate_from_lookup(args) -> str:
+    if args.author is not None:
+        atom_items = db.papers_by_author(args.author)
+        tag = f"author-{args.author}"
     else:
-        atom_items, arxivtime = generate_from_query(cate_list, args)
+        atom_items = db.papers_by_category(args.category)
+        tag = f"category-{args.category}"
+    logger.info(f"{len(atom_items)} papers found for {tag}")
+    tag = re.sub(r"[^\w.-]+", "_", tag)
+    now = utils.get_arxiv_time(datetime.datetime.now(datetime.timezone.utc)).isoformat()
+    return render_feed(atom_items, now, args, tag=tag)
+
+
+def generate_from_search(args) -> str:
+    hits = db.search(args.query, args.limit)
+    logger.info(f"{len(hits)} papers found for `{args.query}`")
+    for atom_item, _, rank in hits:
+        logger.debug("%8.3f %s %s", rank, atom_item.arxivid, atom_item.title)
+    trans_cache = {atom_item.arxivid: trans_item for atom_item, trans_item, _ in hits if trans_item is not None}
+    tag = re.sub(r"[^\w.-]+", "_", f"search-{args.query}")
+    now = utils.get_arxiv_time(datetime.datetime.now(datetime.timezone.utc)).isoformat()
+    return render_feed([atom_item for atom_item, _, _ in hits], now, args, trans_cache, tag=tag)
+
+
+def split_feed(atom_items: list[ATOMItem], args,
+               cate_list: list[str]) -> tuple[dict[str, list[ATOMItem]], dict[str, list[ATOMItem]]]:
     if args.onlynew:
         update_items = list(filter(lambda item: item.is_update(), atom_items))
         atom_items = filter(lambda item: not item.is_update(), atom_items)
@@ -184,8 +254,7 @@ def generate(args):
     cate2item: dict[str, list[ATOMItem]] = defaultdict(list)
     skip2item: dict[str, list[ATOMItem]] = defaultdict(list)
     for item in atom_items:
-        item.title = utils.pre_proc_title(item.title)
-        if args.strict:
+        if args.strict and len(cate_list) != 0:
             if item.primary_category not in cate_list:
                 skip2item[item.primary_category].append(item)
                 continue
@@ -193,48 +262,199 @@ def generate(args):
             skip2item[item.primary_category].append(item)
             continue
         cate2item[item.primary_category].append(item)
+    if args.min_rank is not None:
+        for cate in list(cate2item):
+            below = [item for item in cate2item[cate] if venue.rank_key(item.venue_rank) > venue.rank_key(args.min_rank)]
+            if len(below) != 0:
+                cate2item[cate] = [item for item in cate2item[cate] if item not in below]
+                skip2item[f"{cate} below CCF-{args.min_rank}"] += below
+            if len(cate2item[cate]) == 0:
+                del cate2item[cate]
+    watch = watchlist.load(args.watchlist)
+    if watch is not None:
+        watchlist.score_items(watch, [item for cate in cate2item for item in cate2item[cate]])
+    if args.rank_sort or watch is not None:
+        # rank first when asked for, then the most relevant papers
+        for cate in cate2item:
+            cate2item[cate].sort(key=lambda item: (venue.rank_key(item.venue_rank) if args.rank_sort else 0,
+                                                   -item.relevance))
     logger.debug("; ".join([f"{cate}:{len(cate2item[cate])}" for cate in cate2item]))
+    return cate2item, skip2item
+
 
-    logger.info(f"Generating markdown")
+def write_feed(cate2item: dict[str, list[ATOMItem]], skip2item: dict[str, list[ATOMItem]],
+               translations: dict[str, tuple[str | None, str | None]], arxivtime: str, args, tag: str) -> str:
     arxivdate = utils.get_arxiv_time(arxivtime).strftime("%y%m%d")
-    md_filename = f"Feed-{arxivdate}-{args.collection}.md"
-    md_filepath = path.join(CACHE_GEN, md_filename)
     fetchtime = utils.get_local_time(datetime.datetime.now())
     fetchtime = f"""{fetchtime.strftime("%Y-%m-%d %H:%M")} {datetime.datetime.tzname(fetchtime)}"""
-    with open(md_filepath, "w") as f:
-        f.write(generate_markdown(cate2item, skip2item, args.collection, arxivtime, fetchtime))
-
-    logger.info("Convert result to HTML")
-    with open(md_filepath, "r", encoding='utf-8') as input_file:
-        text = input_file.read()
-    html = generate_html(text, args, "../static/cement/cement.css")
-    html_filename = f"Feed-{arxivdate}-{args.collection}.html"
+    if args.markdown:
+        logger.info(f"Generating markdown")
+        md_filename = f"Feed-{arxivdate}-{tag}.md"
+        md_filepath = path.join(CACHE_GEN, md_filename)
+        with open(md_filepath, "w", encoding="utf-8") as f:
+            f.write(generate_markdown(cate2item, skip2item, translations, tag, arxivtime, fetchtime,
+                                      watchlist.load(args.watchlist)))
+
+    logger.info("Generating HTML")
+    html_filename = f"Feed-{arxivdate}-{tag}.html"
     html_filepath = path.join(CACHE_GEN, html_filename)
     with open(html_filepath, "w", encoding="utf-8", errors="xmlcharrefreplace") as output_file:
-        output_file.write(html)
+        render.write_html(output_file, cate2item, skip2item, translations, tag, arxivtime, fetchtime,
+                          "../static/cement/cement.css", watchlist.load(args.watchlist))
+    return html_filepath
+
+
+def render_feed(atom_items: list[ATOMItem], arxivtime: str, args, trans_cache: dict[str, TransItem] | None = None,
+                tag: str | None = None, cate_list: list[str] | None = None) -> str:
+    cate2item, skip2item = split_feed(atom_items, args, cate_list or [])
+    translations = translate([item for cate in cate2item for item in cate2item[cate]],
+                             (args.translate_title, args.translate_abs), args.translate_force,
+                             args.translate_service, args.translate_workers, trans_cache)
+    return write_feed(cate2item, skip2item, translations, arxivtime, args, tag)
+
+
+def collection_categories(collections: list[str]) -> list[str]:
+    return list(dict.fromkeys(cate for collection in collections for cate in arxivcategory.COLLECTIONS[collection]))
+
+
+def generate_collections(collections: list[str], args) -> list[str]:
+    # one fetch over the union of categories and one translation pass over the unique papers,
+    # then every collection's page is cut from the shared set
+    cate_list = collection_categories(collections)
+    atom_items, arxivtime, id2cate = generate_from_query(cate_list, args)
+    feeds = dict()
+    for collection in collections:
+        collection_cates = set(arxivcategory.COLLECTIONS[collection])
+        collection_items = [item for item in atom_items
+                            if not collection_cates.isdisjoint(id2cate[item.arxivid])]
+        feeds[collection] = split_feed(collection_items, args, arxivcategory.COLLECTIONS[collection])
+    unique_items = {item.arxivid: item for cate2item, _ in feeds.values()
+                    for cate in cate2item for item in cate2item[cate]}
+    translations = translate(list(unique_items.values()),
+                             (args.translate_title, args.translate_abs), args.translate_force,
+                             args.translate_service, args.translate_workers)
+    return [write_feed(cate2item, skip2item, translations, arxivtime, args, collection)
+            for collection, (cate2item, skip2item) in feeds.items()]
 
+
+def parse_collections(collection: str | None) -> list[str]:
+    # `sys`, `ai,sys` or `all`
+    if collection is None:
+        return []
+    if collection == "all":
+        return list(arxivcategory.COLLECTIONS.keys())
+    collections = list(dict.fromkeys(name.strip() for name in collection.split(",")))
+    for name in collections:
+        if name not in arxivcategory.COLLECTIONS:
+            raise ValueError(f"unknown collection `{name}`, expected one of {', '.join(arxivcategory.COLLECTIONS)}")
+    return collections
+
+
+def generate(args):
+    db.init_db(args.tune_db)
+    collections = parse_collections(args.collection)
+    html_filepaths = []
+    if args.command == "search":
+        html_filepaths.append(generate_from_search(args))
+    elif args.author is not None or args.category is not None:
+        html_filepaths.append(generate_from_lookup(args))
+    elif args.history is not None:
+        for collection in collections:
+            html_filepath = None
+            for arxivtime, atom_items, trans_cache in generate_from_history(args.history, collection, args):
+                html_filepath = render_feed(atom_items, arxivtime, args, trans_cache,
+                                            collection, arxivcategory.COLLECTIONS[collection])
+            if html_filepath is not None:
+                html_filepaths.append(html_filepath)
+        if len(html_filepaths) == 0:
+            logger.error(f"nothing logged for {args.history}")
+            return html_filepaths
+    else:
+        html_filepaths += generate_collections(collections, args)
+
+    httpclient.log_stats()
     logger.info("Finish")
     if not args.no_open_browser:
-        webbrowser.open_new_tab(os.path.abspath(html_filepath))
+        for html_filepath in html_filepaths:
+            webbrowser.open_new_tab(os.path.abspath(html_filepath))
+    return html_filepaths
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Fetch feed from arxiv by RSS and its API')
-    parser.add_argument('-c', "--collection", type=str, required=True)
+    parser.add_argument('-c', "--collection", type=str,
+                        help=f"one of {', '.join(arxivcategory.COLLECTIONS)}, several joined by `,`, or `all`")
     parser.add_argument('-V', '--verbose', default=False, action='store_true')
     parser.add_argument('-r', '--refetch', default=False, action='store_true')
     parser.add_argument('--translate-title', default=False, action='store_true')
     parser.add_argument('--translate-abs', default=False, action='store_true')
     parser.add_argument('--translate-force', default=False, action='store_true')
+    parser.add_argument('--translate-service', type=str, default="google", choices=translators.SERVICES.keys())
+    parser.add_argument('--translate-workers', type=int, default=4)
     parser.add_argument('--no-open-browser', default=False, action='store_true')
     parser.add_argument('--strict', default=False, action='store_true')
     parser.add_argument('--onlynew', default=False, action='store_true')
-    parser.add_argument("--history", type=str)
+    parser.add_argument("--history", type=str, help="YYYYMMDD or YYYYMMDD..YYYYMMDD")
+    parser.add_argument('--tune-db', default=False, action='store_true',
+                        help="open the db in WAL mode with relaxed sync and a larger cache")
+    parser.add_argument('--markdown', default=False, action='store_true',
+                        help="also write the feed as markdown next to the html")
+    parser.add_argument("--min-rank", type=str, choices=venue.RANK_ORDER.keys(),
+                        help="only list papers whose comment names a CCF venue of this rank or better")
+    parser.add_argument('--rank-sort', default=False, action='store_true',
+                        help="list papers at CCF-A venues first within each category")
+    parser.add_argument("--watchlist", type=str, default=WATCHLIST_PATH,
+                        help="toml file of weighted [keywords] and [authors]; matching papers are ranked up and highlighted")
+    parser.add_argument("--author", type=str, help="render every stored paper by this author")
+    parser.add_argument("--category", type=str, help="render every stored paper listed in this category")
+    subparsers = parser.add_subparsers(dest="command")
+    search_parser = subparsers.add_parser("search", help="full-text search over stored papers")
+    search_parser.add_argument("query", type=str,
+                               help="keywords, or an sqlite fts5 query; chinese terms need three or more characters")
+    search_parser.add_argument("--limit", type=int, default=50)
+    serve_parser = subparsers.add_parser("serve", help="browse every stored feed over http, rendered on demand")
+    serve.add_arguments(serve_parser)
+    site_parser = subparsers.add_parser("site", help="incrementally build a static archive of every stored feed")
+    sitebuild.add_arguments(site_parser)
+    backfill_parser = subparsers.add_parser("backfill", help="load past papers from the arxiv API into the db")
+    backfill.add_arguments(backfill_parser)
+    cache_parser = subparsers.add_parser("cache", help="inspect or prune the fetch cache")
+    fetchcache.add_arguments(cache_parser)
+    daemon_parser = subparsers.add_parser("daemon", help="wait for each announcement and regenerate when the feed changes")
+    daemon.add_arguments(daemon_parser)
     args = parser.parse_args()
+    if args.command is None and args.collection is None and args.author is None and args.category is None:
+        parser.error("one of -c/--collection, --author, --category or a command is required")
+    if args.command == "daemon" and args.collection is None:
+        parser.error("daemon needs -c/--collection")
+    if args.command == "backfill" and args.collection is None and args.categories is None:
+        parser.error("backfill needs -c/--collection or --categories")
+    try:
+        parse_collections(args.collection)
+    except ValueError as e:
+        parser.error(str(e))
     if args.verbose:
         utils.logger_init(utils.logging.DEBUG)
     else:
         utils.logger_init(utils.logging.INFO)
-    generate(args)
+    if args.command == "cache":
+        fetchcache.command(args)
+    elif args.command == "site":
+        db.init_db(args.tune_db)
+        sitebuild.build(args, split_feed)
+    elif args.command == "serve":
+        db.init_db(args.tune_db)
+        serve.run(args, split_feed)
+    elif args.command == "backfill":
+        db.init_db(args.tune_db)
+        if args.categories is not None:
+            cate_list = [cate.strip() for cate in args.categories.split(",")]
+        else:
+            cate_list = collection_categories(parse_collections(args.collection))
+        backfill.run(args, cate_list, *parse_history(args.range))
+    elif args.command == "daemon":
+        daemon.run(args, collection_categories(parse_collections(args.collection)), generate)
+    else:
+        generate(args)
 
 """
 TODO [] Special character
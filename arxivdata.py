@@ -1,4 +1,8 @@
+import copy
+import io
+import sys
 from dataclasses import dataclass
+from typing import Iterator
 
 import lxml.etree as etree
 
@@ -6,6 +10,7 @@ import utils
 from utils import logger
 
 ABS_PREFIX = "http://arxiv.org/abs/"
+PDF_PREFIX = "http://arxiv.org/pdf/"
 
 
 @dataclass
@@ -35,7 +40,7 @@ class RSSMetaNew:
     lastBuildDate: str
     pubDate: str
 
-@dataclass
+@dataclass(slots=True)
 class RSSItemNew:
     arxivid: str
     title: str
@@ -43,124 +48,228 @@ class RSSItemNew:
     description: str
     announcetype: str
     authors: str
+    category: tuple[str, ...] = ()
     
     def is_update(self) -> bool:
         return self.announcetype.find("new") != -1
     def is_crosslist(self) -> bool:
         return self.announcetype.find("cross") != -1
 
-@dataclass
+@dataclass(slots=True)
 class ATOMItem:
+    # slotted and lean: author/category are tuples, category codes are interned,
+    # and id/link_abs/link_pdf are derived from arxivid instead of stored
     arxivid: str
-    id: str
     updated: str
     published: str
     title: str
     summary: str
-    author: list[str]
+    author: tuple[str, ...]
     comment: str | None
-    link_abs: str
-    link_pdf: str
-    category: list[str]
+    category: tuple[str, ...]
     primary_category: str
+    # filled by `normalize` when the paper is ingested, read back from the db afterwards
+    title_clean: str | None = None
+    summary_clean: str | None = None
+    # CCF venue found in the comment, see `venue.annotate`
+    venue: str | None = None
+    venue_rank: str | None = None
+    # watchlist relevance, computed per run by `watchlist.score_items` and never stored
+    relevance: float = 0.0
+    watch_hits: tuple[str, ...] = ()
+
+    def __post_init__(self):
+        self.author = tuple(self.author)
+        self.category = tuple(sys.intern(category) for category in self.category)
+        self.primary_category = sys.intern(self.primary_category)
+
+    @property
+    def id(self) -> str:
+        return ABS_PREFIX + self.arxivid
+
+    @property
+    def link_abs(self) -> str:
+        return ABS_PREFIX + self.arxivid
+
+    @property
+    def link_pdf(self) -> str:
+        return PDF_PREFIX + self.arxivid
 
     def is_update(self) -> bool:
         return self.updated != self.published
 
 
-def parse_atom(atom_str: str) -> list[ATOMItem]:
-    atom = etree.XML(atom_str)
-    nsmap = atom.nsmap
-    nsmap["ns"] = nsmap[None]
-    nsmap["arxiv"] = "http://arxiv.org/schemas/atom"
-    del nsmap[None]  # none key is not allow in lxml xpath
-    entries = atom.xpath("/ns:feed/ns:entry", namespaces=nsmap)
-    query_results = []
-    for entry in entries:
-        id = entry.xpath("./ns:id", namespaces=nsmap)[0].text
-        assert id.startswith(ABS_PREFIX)
-        id_short = id.removeprefix(ABS_PREFIX)
-        updated = entry.xpath("./ns:updated", namespaces=nsmap)[0].text
-        published = entry.xpath("./ns:published", namespaces=nsmap)[0].text
-        title = entry.xpath("./ns:title", namespaces=nsmap)[0].text
-        summary = entry.xpath("./ns:summary", namespaces=nsmap)[0].text
-
-        comment_elems = entry.xpath("./arxiv:comment", namespaces=nsmap)
-        comment = None if len(comment_elems) == 0 else comment_elems[0].text
-
-        author_elems = entry.xpath("./ns:author/ns:name", namespaces=nsmap)
-        authors = [elem.text for elem in author_elems]
-
-        link_abs = entry.xpath("./ns:link[@rel='alternate']", namespaces=nsmap)[0].attrib["href"]
-        link_pdf = entry.xpath("./ns:link[@title='pdf']", namespaces=nsmap)[0].attrib["href"]
-
-        primary_category = entry.xpath("./arxiv:primary_category",
-                                       namespaces=nsmap)[0].attrib["term"]
-        category_elems = entry.xpath("./ns:category", namespaces=nsmap)
-        categories = [elem.attrib["term"] for elem in category_elems]
-
-        atom_item = ATOMItem(
-            id=id,
-            arxivid=id_short,
-            updated=updated,
-            published=published,
-            title=title.replace('\n', ''),
-            summary=summary,
-            author=authors,
-            comment=comment,
-            link_abs=link_abs,
-            link_pdf=link_pdf,
-            category=categories,
-            primary_category=primary_category,
-        )
-        query_results.append(atom_item)
-    return query_results
-
-
-def parse_rss_new(rss_str: str) -> tuple[RSSMetaNew, list[RSSItemNew]]:
-    xml = etree.XML(rss_str)
-    nsmap = xml.nsmap
-    def get_text(item, xpath: str) -> str: return item.xpath(xpath,  namespaces=nsmap)[0].text
-
-    rss_chan = xml.xpath("/rss/channel")[0]
-
-    meta_title = get_text(rss_chan, "./title")
-    meta_description = get_text(rss_chan, "./description")
-    meta_lastBuildDate = get_text(rss_chan, "./lastBuildDate")
-    meta_pubDate = get_text(rss_chan, "./pubDate")
-    rss_meta = RSSMetaNew(title=meta_title,
-                          description=meta_description,
-                          lastBuildDate=meta_lastBuildDate,
-                          pubDate=meta_pubDate)
-    logger.debug(rss_meta)
+def normalize(atom_item: ATOMItem) -> ATOMItem:
+    atom_item.title_clean = utils.pre_proc_title(atom_item.title)
+    try:
+        atom_item.summary_clean = utils.pre_process_abstract(atom_item.summary)
+    except (AssertionError, IndexError):
+        logger.warning(f"unexpected abstract layout in {atom_item.arxivid}")
+        atom_item.summary_clean = utils.pre_process_latex(atom_item.summary.strip())
+    return atom_item
+
+
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+ARXIV_NS = "{http://arxiv.org/schemas/atom}"
+DC_NS = "{http://purl.org/dc/elements/1.1/}"
+OPENSEARCH_NS = "{http://a9.com/-/spec/opensearch/1.1/}"
+
+
+def _as_stream(xml_str: str | bytes) -> io.BytesIO:
+    return io.BytesIO(xml_str.encode() if isinstance(xml_str, str) else xml_str)
+
+
+def _release(elem):
+    # drop the element and the already handled siblings before it, keeps memory flat
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+def _atom_entry(entry) -> ATOMItem:
+    id = updated = published = title = summary = comment = None
+    primary_category = None
+    authors = []
+    categories = []
+    for child in entry:
+        tag = child.tag
+        if tag == ATOM_NS + "id":
+            id = id or child.text
+        elif tag == ATOM_NS + "updated":
+            updated = updated or child.text
+        elif tag == ATOM_NS + "published":
+            published = published or child.text
+        elif tag == ATOM_NS + "title":
+            title = title or child.text
+        elif tag == ATOM_NS + "summary":
+            summary = summary or child.text
+        elif tag == ATOM_NS + "author":
+            authors += [name.text for name in child.iterchildren(ATOM_NS + "name")]
+        elif tag == ATOM_NS + "category":
+            categories.append(child.get("term"))
+        elif tag == ARXIV_NS + "comment":
+            comment = comment or child.text
+        elif tag == ARXIV_NS + "primary_category":
+            primary_category = primary_category or child.get("term")
+    assert id.startswith(ABS_PREFIX)
+    return ATOMItem(
+        arxivid=id.removeprefix(ABS_PREFIX),
+        updated=updated,
+        published=published,
+        title=title.replace('\n', ''),
+        summary=summary,
+        author=authors,
+        comment=comment,
+        category=categories,
+        primary_category=primary_category,
+    )
+
+
+def iter_atom(atom_str: str | bytes) -> Iterator[ATOMItem]:
+    for _, entry in etree.iterparse(_as_stream(atom_str), events=("end",), tag=ATOM_NS + "entry"):
+        yield _atom_entry(entry)
+        _release(entry)
 
-    items = rss_chan.xpath("./item", namespaces=nsmap)
+
+def parse_atom(atom_str: str | bytes) -> list[ATOMItem]:
+    return list(iter_atom(atom_str))
+
+
+def atom_total_results(atom_str: str | bytes) -> int | None:
+    # the header comes before any entry, so only the head of the page is parsed
+    for _, elem in etree.iterparse(_as_stream(atom_str), events=("end",), tag=OPENSEARCH_NS + "totalResults"):
+        return int(elem.text)
+    return None
+
+
+def split_atom(atom_str: bytes) -> dict[str, bytes]:
+    # one standalone single-entry feed per paper, so each one can be cached on its own
+    papers = dict()
+    feed_tag = ATOM_NS + "feed"
+    for _, entry in etree.iterparse(_as_stream(atom_str), events=("end",), tag=ATOM_NS + "entry"):
+        id = entry.findtext(ATOM_NS + "id")
+        feed = etree.Element(feed_tag, nsmap=entry.getparent().nsmap)
+        feed.append(copy.deepcopy(entry))
+        papers[id.removeprefix(ABS_PREFIX)] = etree.tostring(feed, xml_declaration=True, encoding="UTF-8")
+        _release(entry)
+    return papers
+
+
+RSS_META_TAGS = ("title", "description", "lastBuildDate", "pubDate")
+
+
+def _rss_item(item) -> RSSItemNew:
+    fields = dict()
+    authors = []
+    categories = []
+    for child in item:
+        tag = child.tag
+        if tag == DC_NS + "creator":
+            authors.append(child.text)
+        elif tag == "category":
+            categories.append(sys.intern(child.text))
+        elif tag not in fields:
+            fields[tag] = child.text
+    return RSSItemNew(
+        arxivid=fields["guid"].split(":")[-1],
+        title=fields["title"],
+        link=fields["link"],
+        description=fields["description"],
+        announcetype=fields[ARXIV_NS + "announce_type"],
+        authors=",".join(authors),
+        category=tuple(categories)
+    )
+
+
+def iter_rss_new(rss_str: str | bytes) -> Iterator[RSSMetaNew | RSSItemNew]:
+    # yields the channel's RSSMetaNew first (its fields precede the items), then every RSSItemNew
+    meta_fields = dict()
+    meta_done = False
+    for _, elem in etree.iterparse(_as_stream(rss_str), events=("end",)):
+        parent = elem.getparent()
+        if parent is None or parent.tag != "channel":
+            continue
+        if elem.tag == "item":
+            if not meta_done:
+                meta_done = True
+                yield RSSMetaNew(**{tag: meta_fields.get(tag) for tag in RSS_META_TAGS})
+            yield _rss_item(elem)
+            _release(elem)
+        elif elem.tag in RSS_META_TAGS and elem.tag not in meta_fields:
+            meta_fields[elem.tag] = elem.text
+    if not meta_done:
+        yield RSSMetaNew(**{tag: meta_fields.get(tag) for tag in RSS_META_TAGS})
+
+
+def parse_rss_new(rss_str: str | bytes) -> tuple[RSSMetaNew, list[RSSItemNew]]:
+    rss_stream = iter_rss_new(rss_str)
+    rss_meta = next(rss_stream)
+    logger.debug(rss_meta)
     rss_items = list()
-    logger.info(f"{meta_title} {len(items)} Updates")
-    for item in items:
-        item_title = get_text(item, "title")
-        item_link = get_text(item, "link")
-        item_description = get_text(item, "./description")
-        item_announce_type = get_text(item, "./arxiv:announce_type")
-        item_guid = get_text(item, "./guid")
-        item_authors = item.xpath("./dc:creator", namespaces=nsmap)
-
-        _authors = ",".join([_author.text for _author in item_authors])
-        _arxivid = item_guid.split(":")[-1]
-        rss_item = RSSItemNew(
-            arxivid=_arxivid,
-            title=item_title,
-            link=item_link,
-            description=item_description,
-            announcetype=item_announce_type,
-            authors=_authors
-        )
+    for rss_item in rss_stream:
         rss_items.append(rss_item)
-        logger.debug(f"  {item_title}")
-    
+        logger.debug(f"  {rss_item.title}")
+    logger.info(f"{rss_meta.title} {len(rss_items)} Updates")
     return rss_meta, rss_items
 
 
+def merge_rss_meta(rss_metas: dict[str, RSSMetaNew]) -> RSSMetaNew:
+    # feeds of one announcement share their dates; if they do not, trust the latest one
+    metas = list(rss_metas.values())
+    pub_dates = set(meta.pubDate for meta in metas)
+    if len(pub_dates) > 1:
+        logger.warning("RSS pubDate differs across categories: %s",
+                       ", ".join(f"{cate}={meta.pubDate}" for cate, meta in rss_metas.items()))
+    latest = max(metas, key=lambda meta: utils.parse_time(meta.pubDate))
+    last_build = max(metas, key=lambda meta: utils.parse_time(meta.lastBuildDate))
+    return RSSMetaNew(title=" + ".join(meta.title for meta in metas),
+                      description=latest.description,
+                      lastBuildDate=last_build.lastBuildDate,
+                      pubDate=latest.pubDate)
+
+
 def parse_rss(rss_str: str) -> tuple[RSSMeta, list[RSSItem]]:
     xml = etree.XML(rss_str)
     nsmap = xml.nsmap
@@ -196,3 +305,15 @@ MetaData
         rss_results.append(data)
         logger.debug(f"  {_title}")
     return rss_metadata, rss_results
+
+
+if __name__ == "__main__":
+    # per-paper memory footprint of parsed records: `python arxivdata.py some.atom`
+    import tracemalloc
+    with open(sys.argv[1], "rb") as f:
+        atom_str = f.read()
+    tracemalloc.start()
+    atom_items = parse_atom(atom_str)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{len(atom_items)} papers, {current / max(1, len(atom_items)):.0f} bytes per paper")
@@ -1,58 +1,99 @@
-import datetime
-import hashlib
-import os
-import os.path as path
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import requests
-
-from config import API_BASE, CACHE_FETCH, RSS_BASE
+import fetchcache
+import httpclient
+from arxivdata import iter_rss_new, split_atom
+from config import API_BASE, RSS_BASE, RSS_MAX_URL
 from utils import logger
 
 
-def query_rss(subcategory="cs", force=False) -> str:
+def query_rss(subcategory="cs", force=False) -> bytes:
+    # revalidates the cached body with its ETag/Last-Modified, so an unchanged feed costs one 304.
+    # the entry remembers the feed's own pubDate rather than the wall-clock date it was fetched on
     rss_url = RSS_BASE + subcategory
-    today_filename = datetime.date.today().strftime("%y%m%d")
-    rss_filename = f"{today_filename}-{subcategory}.xml"
-    rss_filepath = path.join(CACHE_FETCH, rss_filename)
-    if path.exists(rss_filepath) and not force:
-        logger.warning(f"use cached `{rss_filepath}`")
-        with open(rss_filepath, "rb") as f:
-            rss_str = f.read()
-        return rss_str
+    cached = fetchcache.get(rss_url, ttl=None)
+    headers = dict()
+    if not force and cached is not None:
+        if cached.etag is not None:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified is not None:
+            headers["If-Modified-Since"] = cached.last_modified
+
     logger.info(f"getting rss from {rss_url}")
-    rss_resp = requests.get(rss_url)
-    with open(rss_filepath, "w") as f:
-        f.write(rss_resp.text)
+    rss_resp = httpclient.get(rss_url, headers=headers)
+    if rss_resp.status_code == 304:
+        logger.warning(f"rss not modified, use cached feed of {cached.meta.get('pubDate')}")
+        fetchcache.touch(rss_url)
+        return cached.content
+    rss_resp.raise_for_status()
+    rss_str = rss_resp.content
+    rss_meta = next(iter_rss_new(rss_str))
+    fetchcache.put(rss_url, None, rss_str, rss_resp.headers.get("ETag"), rss_resp.headers.get("Last-Modified"),
+                   {"pubDate": rss_meta.pubDate})
     logger.info(f"rss got from {rss_url}")
-    return rss_resp.text.encode()
+    return rss_str
+
+
+def chunk_categories(cate_list: list[str], max_url_len=RSS_MAX_URL) -> list[list[str]]:
+    # the endpoint takes `cs.AI+cs.LG+...`; sorted so the same set always maps to the same url and cache file
+    chunks = [[]]
+    url_len = len(RSS_BASE)
+    for cate in sorted(set(cate_list)):
+        if len(chunks[-1]) != 0 and url_len + 1 + len(cate) > max_url_len:
+            chunks.append([])
+            url_len = len(RSS_BASE)
+        url_len += len(cate) + (1 if len(chunks[-1]) != 0 else 0)
+        chunks[-1].append(cate)
+    return [chunk for chunk in chunks if len(chunk) != 0]
+
 
+def query_rss_many(cate_list: list[str], force=False, workers=8):
+    # yields (categories, rss_str) for each combined feed as soon as it arrives
+    chunks = chunk_categories(cate_list)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as pool:
+        futures = {pool.submit(query_rss, "+".join(chunk), force): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def _atom_cache_params(arxivid: str) -> dict[str, str]:
+    # pages are split per paper before caching, so each paper gets the key of a single-id query
+    return {"id_list": arxivid}
+
+
+def query_atom(id_list, items_per_req=20, force=False, req_interval=3, force_ids=frozenset()):
+    # yields one Atom document at a time: cached papers first, then one page per request.
+    # entries are cached per paper, so a different id set does not invalidate the others.
+    # ids in `force_ids` (e.g. replaced papers) always skip the cache
+    pending = []
+    cached = 0
+    for arxivid in id_list:
+        entry = None if force or arxivid in force_ids else fetchcache.get(API_BASE, _atom_cache_params(arxivid))
+        if entry is not None:
+            cached += 1
+            yield entry.content
+        else:
+            pending.append(arxivid)
+    if cached != 0:
+        logger.warning(f"use {cached} cached papers from the fetch cache")
 
-def query_atom(id_list, items_per_req=20, force=False, req_interval=3):
     start = 0
-    atom_strs = []
-    while start < len(id_list):
-        id_list_slice = id_list[start: start + items_per_req]
+    while start < len(pending):
+        id_list_slice = pending[start: start + items_per_req]
         start += items_per_req
         id_list_str = ",".join(id_list_slice)
-        id_list_hash = hashlib.sha256(id_list_str.encode()).hexdigest()
-        today_filename = datetime.date.today().strftime("%y%m%d")
-        atom_filename = f"{today_filename}-pg{items_per_req}-{id_list_hash}.atom"
-        atom_filepath = path.join(CACHE_FETCH, atom_filename)
-
-        if path.exists(atom_filepath) and not force:
-            logger.warning(f"use cached `{atom_filepath}`")
-            with open(atom_filepath, "rb") as f:
-                atom_str = f.read()
-                atom_strs.append(atom_str)
-            continue
-
         params = {"id_list": id_list_str, "max_results": items_per_req}
         logger.info(f"query for {len(id_list_slice)} items")
-        atom_resp = requests.get(API_BASE, params=params)
-        with open(atom_filepath, "w") as f:
-            f.write(atom_resp.text)
+        atom_resp = httpclient.get(API_BASE, params=params)
         logger.info(f"query done from {atom_resp.url}")
-        atom_strs.append(atom_resp.text.encode())
-        time.sleep(req_interval)
-    return atom_strs
+        atom_str = atom_resp.content
+        papers = split_atom(atom_str)
+        for arxivid, paper_str in papers.items():
+            fetchcache.put(API_BASE, _atom_cache_params(arxivid), paper_str)
+        missing = set(id_list_slice) - set(papers)
+        if len(missing) != 0:
+            logger.error(f"API returned no entry for {', '.join(sorted(missing))}")
+        yield atom_str
+        if start < len(pending):
+            time.sleep(req_interval)
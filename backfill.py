@@ -0,0 +1,134 @@
+import datetime
+import time
+from typing import Iterator
+
+import db
+import httpclient
+import utils
+from arxivdata import ATOMItem, atom_total_results, parse_atom
+from config import API_BASE, API_MAX_RESULTS, ARXIV_SUBMIT_CUTOFF
+from db import MainLogItem
+from utils import logger
+
+
+def announce_time(published: str) -> str:
+    # daily key of the mailing a new submission went out in: submissions before the weekday cutoff
+    # are announced that evening and dated the next weekday. holidays are not accounted for
+    submitted = utils.get_arxiv_time(published)
+    cutoff = datetime.time(*ARXIV_SUBMIT_CUTOFF)
+    day = submitted.date()
+    if day.weekday() >= 5 or submitted.time() >= cutoff:
+        day += datetime.timedelta(days=1)
+        while day.weekday() >= 5:
+            day += datetime.timedelta(days=1)
+    day += datetime.timedelta(days=1)
+    while day.weekday() >= 5:
+        day += datetime.timedelta(days=1)
+    return utils.get_arxiv_day(day)
+
+
+def windows(start: datetime.date, end: datetime.date, days: int) -> list[tuple[datetime.date, datetime.date]]:
+    # [start, end) cut into consecutive windows of `days`
+    result = []
+    while start < end:
+        window_end = min(start + datetime.timedelta(days=days), end)
+        result.append((start, window_end))
+        start = window_end
+    return result
+
+
+def search_query(category: str, window_start: datetime.date, window_end: datetime.date) -> str:
+    # `cs` or `cs.*` covers every subcategory
+    if "." not in category:
+        category += ".*"
+    return f"cat:{category} AND submittedDate:[{window_start:%Y%m%d}0000 TO {window_end:%Y%m%d}0000]"
+
+
+def daily_categories(item: ATOMItem, category: str) -> list[str]:
+    if "." in category and not category.endswith(".*"):
+        return [category]
+    prefix = category.removesuffix(".*") + "."
+    return [cate for cate in item.category if cate.startswith(prefix)]
+
+
+def fetch_page(params: dict, limiter: utils.TokenBucket, retries: int) -> bytes:
+    # the API now and then answers with an error or an empty page for a valid offset, those are retried
+    delay = 5
+    for attempt in range(retries + 1):
+        if attempt != 0:
+            time.sleep(delay)
+            delay *= 2
+        limiter.acquire()
+        try:
+            atom_resp = httpclient.get(API_BASE, params=params, timeout=120)
+            atom_resp.raise_for_status()
+        except Exception as e:
+            logger.warning(f"request failed ({type(e).__name__}: {e})")
+            continue
+        atom_str = atom_resp.content
+        total = atom_total_results(atom_str)
+        if total is not None and (total <= params["start"] or b"<entry" in atom_str):
+            return atom_str
+        logger.warning(f"empty page at {params['start']} of {total}")
+    raise RuntimeError(f"giving up on `{params['search_query']}` at {params['start']} after {retries} retries")
+
+
+def iter_pages(query: str, start: int, total: int | None, page_size: int, limiter: utils.TokenBucket,
+               retries: int) -> Iterator[tuple[int, int, bytes]]:
+    while total is None or start < total:
+        params = {"search_query": query, "start": start, "max_results": page_size,
+                  "sortBy": "submittedDate", "sortOrder": "ascending"}
+        atom_str = fetch_page(params, limiter, retries)
+        total = atom_total_results(atom_str)
+        yield start, total, atom_str
+        start += page_size
+
+
+def backfill_window(category: str, window_start: datetime.date, window_end: datetime.date, args,
+                    limiter: utils.TokenBucket) -> int:
+    ws, we = window_start.isoformat(), window_end.isoformat()
+    progress = db.backfill_get(category, ws, we)
+    if progress is not None and progress[2]:
+        return 0
+    start, total = (progress[0], progress[1]) if progress is not None else (0, None)
+    query = search_query(category, window_start, window_end)
+    if start != 0:
+        logger.info(f"resuming {category} {ws}..{we} at {start}/{total}")
+
+    written = 0
+    # page N is parsed and written while page N+1 is being downloaded
+    pages = iter_pages(query, start, total, args.page_size, limiter, args.retries)
+    for page_start, total, atom_str in utils.prefetch(pages):
+        atom_items = parse_atom(atom_str)
+        daily_items = [MainLogItem(item.arxivid, announce_time(item.published), cate)
+                       for item in atom_items for cate in daily_categories(item, category)]
+        next_start = page_start + args.page_size
+        db.backfill_page_set(category, ws, we, atom_items, daily_items, next_start, total, next_start >= total)
+        written += len(atom_items)
+        logger.info(f"{category} {ws}..{we}: {min(next_start, total)}/{total}")
+        if total > API_MAX_RESULTS:
+            logger.warning(f"{category} {ws}..{we} matches {total} papers, the API stops at {API_MAX_RESULTS}; "
+                           f"use a smaller --window-days")
+    return written
+
+
+def run(args, cate_list: list[str], start: str, end: str):
+    limiter = utils.TokenBucket(1 / args.interval)
+    window_list = windows(datetime.date.fromisoformat(start), datetime.date.fromisoformat(end), args.window_days)
+    logger.info(f"Backfilling {', '.join(cate_list)} over {len(window_list)} windows from {start} to {end}")
+    written = 0
+    for category in cate_list:
+        for window_start, window_end in window_list:
+            written += backfill_window(category, window_start, window_end, args, limiter)
+    logger.info(f"Backfill done, {written} papers written")
+
+
+def add_arguments(backfill_parser):
+    backfill_parser.add_argument("range", type=str, help="YYYYMMDD or YYYYMMDD..YYYYMMDD, submission dates")
+    backfill_parser.add_argument("--categories", type=str,
+                                 help="comma separated, `cs` for every cs.* category; defaults to -c's categories")
+    backfill_parser.add_argument("--window-days", type=int, default=7,
+                                 help="days per query, keep each window under the API's result cap")
+    backfill_parser.add_argument("--page-size", type=int, default=1000)
+    backfill_parser.add_argument("--interval", type=float, default=3, help="seconds between API requests")
+    backfill_parser.add_argument("--retries", type=int, default=5)
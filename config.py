@@ -2,10 +2,30 @@ import os
 import os.path
 
 RSS_BASE = "http://rss.arxiv.org/rss/"
+RSS_MAX_URL = 1024
 API_BASE = "http://export.arxiv.org/api/query"
+API_MAX_RESULTS = 30000
 CACHE_FETCH = "cache/fetch/"
 if not os.path.exists(CACHE_FETCH):
     os.makedirs(CACHE_FETCH)
+FETCH_CACHE_STORE = "cache/fetch/store/"
+if not os.path.exists(FETCH_CACHE_STORE):
+    os.makedirs(FETCH_CACHE_STORE)
+FETCH_CACHE_TTL = 30 * 86400
+FETCH_CACHE_MAX_BYTES = 256 * 1024 * 1024
 CACHE_GEN = "output/"
 if not os.path.exists(CACHE_GEN):
     os.makedirs(CACHE_GEN)
+HTTP_POOL_SIZE = 8
+# (connect, read) seconds for every request unless the caller passes its own `timeout`
+HTTP_TIMEOUT = (10, 60)
+SERVE_CACHE_BYTES = 64 * 1024 * 1024
+SITE_ROOT = "site/"
+# arxiv announces at 20:00 in its timezone, sunday to thursday
+DAEMON_ANNOUNCE_TIME = (20, 0)
+DAEMON_ANNOUNCE_DAYS = (6, 0, 1, 2, 3)
+DAEMON_STATUS = "cache/daemon-status.json"
+# new submissions received before this time on a weekday make that evening's announcement
+ARXIV_SUBMIT_CUTOFF = (14, 0)
+VENUE_MATCH_ABSTRACT = False
+WATCHLIST_PATH = "watchlist.toml"
@@ -0,0 +1,123 @@
+import datetime
+import json
+import os
+import random
+import time
+from typing import Callable
+
+import db
+import utils
+from arxivdata import iter_rss_new
+from arxivquery import query_rss_many
+from config import DAEMON_ANNOUNCE_DAYS, DAEMON_ANNOUNCE_TIME, DAEMON_STATUS
+from utils import logger
+
+
+def next_announcement(now: datetime.datetime) -> datetime.datetime:
+    # next announce slot in arxiv's timezone, on the weekdays arxiv announces
+    now = now.astimezone(utils._arxiv_tz)
+    hour, minute = DAEMON_ANNOUNCE_TIME
+    day = now.date()
+    while True:
+        # localized per day, the offset differs across a daylight saving switch
+        candidate = utils._arxiv_tz.localize(datetime.datetime.combine(day, datetime.time(hour, minute)))
+        if candidate > now and candidate.weekday() in DAEMON_ANNOUNCE_DAYS:
+            return candidate
+        day += datetime.timedelta(days=1)
+
+
+def poll_feeds(cate_list: list[str]) -> dict[str, list[str]]:
+    # conditional requests, so an unchanged feed is a 304; only the channel header is parsed
+    feed_state = dict()
+    for chunk, rss_str in query_rss_many(cate_list):
+        rss_meta = next(iter_rss_new(rss_str))
+        feed_state["+".join(chunk)] = [rss_meta.pubDate, rss_meta.lastBuildDate]
+    return feed_state
+
+
+def load_status(status_path: str) -> dict:
+    if not os.path.exists(status_path):
+        return dict()
+    with open(status_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_status(status_path: str, status: dict, **fields):
+    status.update(fields)
+    status["updated"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    tmp_path = status_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(status, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, status_path)
+
+
+def sleep_until(when: datetime.datetime):
+    while True:
+        remaining = (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, 600))
+
+
+def jittered(interval: float, jitter: float) -> float:
+    return interval * (1 + random.uniform(-jitter, jitter))
+
+
+def run(args, cate_list: list[str], generate: Callable[..., list[str]]):
+    args.no_open_browser = True
+    status_path = args.status_file
+    status = load_status(status_path)
+    write_status(status_path, status, state="starting", collection=args.collection, pid=os.getpid())
+
+    # poll once right away so a restart catches up on an announcement it slept through
+    wake = datetime.datetime.now(datetime.timezone.utc)
+    while True:
+        write_status(status_path, status, state="sleeping", next_poll=wake.isoformat())
+        logger.info(f"sleeping until {utils.get_arxiv_time(wake).isoformat()}")
+        sleep_until(wake)
+
+        interval = args.poll_interval
+        deadline = time.monotonic() + args.poll_window * 60
+        while True:
+            try:
+                write_status(status_path, status, state="polling")
+                feed_state = poll_feeds(cate_list)
+                status["polls"] = status.get("polls", 0) + 1
+                if feed_state != status.get("feed_state"):
+                    logger.info("feed changed, running the pipeline")
+                    write_status(status_path, status, state="generating", feed_state_pending=feed_state)
+                    html_filepaths = generate(args)
+                    db.close_db()
+                    status.pop("feed_state_pending", None)
+                    write_status(status_path, status, state="generated", feed_state=feed_state,
+                                 last_generated=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                                 outputs=html_filepaths, last_error=None)
+                    break
+                logger.info("feed unchanged")
+                interval = min(interval * args.backoff, args.max_interval)
+            except Exception as e:
+                logger.exception("poll failed")
+                write_status(status_path, status, state="error", last_error=f"{type(e).__name__}: {e}")
+                interval = min(interval * args.backoff, args.max_interval)
+            if time.monotonic() + interval > deadline:
+                logger.warning("no new announcement within the poll window")
+                break
+            time.sleep(jittered(interval, args.jitter))
+
+        wake = next_announcement(datetime.datetime.now(datetime.timezone.utc))
+        wake += datetime.timedelta(seconds=random.uniform(0, args.start_jitter))
+
+
+def add_arguments(daemon_parser):
+    daemon_parser.add_argument("--poll-interval", type=float, default=300,
+                               help="seconds between polls right after the announcement time")
+    daemon_parser.add_argument("--backoff", type=float, default=1.5,
+                               help="poll interval multiplier after each unchanged poll")
+    daemon_parser.add_argument("--max-interval", type=float, default=1800)
+    daemon_parser.add_argument("--jitter", type=float, default=0.1,
+                               help="fraction of the interval to randomize each sleep by")
+    daemon_parser.add_argument("--start-jitter", type=float, default=60,
+                               help="up to this many seconds are added to each scheduled wake up")
+    daemon_parser.add_argument("--poll-window", type=float, default=240,
+                               help="minutes to keep polling after the announcement time")
+    daemon_parser.add_argument("--status-file", type=str, default=DAEMON_STATUS)
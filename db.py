@@ -1,7 +1,12 @@
+import hashlib
 import sqlite3
 from dataclasses import dataclass
+from typing import Iterable, Iterator
 
-from arxivdata import ATOMItem, parse_atom
+from arxivdata import ATOMItem, normalize, parse_atom
+import utils
+import venue
+from utils import logger
 
 DB_PATH = "cache/arxivfeed.db"
 create_table_querys = [
@@ -38,66 +43,227 @@ CREATE TABLE IF NOT EXISTS daily (
 ]
 conn: sqlite3.Connection = None
 
+PAPER_META_FIELDS = [
+    "arxivid", "id", "updated", "published", "title", "summary", "author", "comment",
+    "link_abs", "link_pdf", "category", "primary_category",
+    "title_clean", "summary_clean", "norm_version",
+    "venue", "venue_rank", "venue_version"]
+PAPER_META_INSERT = f"INSERT INTO paper_meta ({', '.join(PAPER_META_FIELDS)}) VALUES ({', '.join('?' * len(PAPER_META_FIELDS))})"
+PAPER_META_UPDATE = ", ".join(f"{column} = excluded.{column}" for column in PAPER_META_FIELDS[1:])
 
-@dataclass
+# opt-in, see `init_db(tuned=True)`: WAL lets readers run alongside the writer,
+# NORMAL sync is still crash safe under WAL, 64MB page cache
+TUNED_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,
+    "temp_store": "MEMORY",
+}
+
+
+@dataclass(slots=True)
 class TransItem:
     arxivid: str  # unique id
     title: str
     abs: str
 
 
-@dataclass
+@dataclass(slots=True)
 class MainLogItem:
     arxivid: str
     arxivtime: str
     category: str
 
 
+# sqlite limits the number of host parameters in one statement
+MAX_QUERY_PARAMS = 500
+
+# author names may contain commas, paper_meta.author keeps them in order joined by AUTHOR_SEP.
+# paper_author is the index for lookups by name
+AUTHOR_SEP = "\x1f"
+PAPER_META_COLUMNS = '''
+    paper_meta.arxivid, paper_meta.id, paper_meta.updated, paper_meta.published,
+    paper_meta.title, paper_meta.summary,
+    paper_meta.author, paper_meta.comment, paper_meta.link_abs, paper_meta.link_pdf,
+    paper_meta.category, paper_meta.primary_category,
+    paper_meta.title_clean, paper_meta.summary_clean,
+    paper_meta.venue, paper_meta.venue_rank
+'''
+PAPER_META_NCOLS = 16
+
+
+# full-text index over paper_meta (paper_fts) and translations (paper_fts_zh), see `_fts_refresh`.
+# unicode61 reads a run of CJK characters as one token, so the translations get a trigram index
+FTS_COLUMNS = "arxivid, title, summary, comment"
+FTS_ZH_COLUMNS = "arxivid, tr_title, tr_abs"
+FTS_SELECT = '''
+    SELECT paper_meta.arxivid,
+           COALESCE(paper_meta.title_clean, paper_meta.title), COALESCE(paper_meta.summary_clean, paper_meta.summary),
+           paper_meta.comment,
+           translations.title, translations.abs
+    FROM paper_meta LEFT JOIN translations ON translations.arxivid = paper_meta.arxivid
+'''
+# bm25 weight of each column above, a hit in a title counts more than one in an abstract
+FTS_WEIGHTS = "0.0, 10.0, 1.0, 2.0"
+FTS_ZH_WEIGHTS = "0.0, 10.0, 1.0"
+
+
+def _row2atom(result) -> ATOMItem:
+    return ATOMItem(
+        arxivid=result[0],
+        updated=result[2],
+        published=result[3],
+        title=result[4],
+        summary=result[5],
+        author=result[6].split(AUTHOR_SEP) if result[6] else [],
+        comment=result[7],
+        category=result[10].split(','),  # 将逗号分隔的字符串转换为列表
+        primary_category=result[11],
+        title_clean=result[12],
+        summary_clean=result[13],
+        venue=result[14],
+        venue_rank=result[15]
+    )
+
+
 def paper_meta_get(arxivid: str) -> ATOMItem:
-    select_query = "SELECT * FROM paper_meta WHERE arxivid = ?"
+    select_query = f"SELECT {PAPER_META_COLUMNS} FROM paper_meta WHERE arxivid = ?"
     result = conn.execute(select_query, (arxivid,)).fetchone()
     if result is not None:
-        return ATOMItem(
-            arxivid=result[0],
-            id=result[1],
-            updated=result[2],
-            published=result[3],
-            title=result[4],
-            summary=result[5],
-            author=result[6].split(','),  # 将逗号分隔的字符串转换为列表
-            comment=result[7],
-            link_abs=result[8],
-            link_pdf=result[9],
-            category=result[10].split(','),  # 将逗号分隔的字符串转换为列表
-            primary_category=result[11]
-        )
+        return _row2atom(result)
     else:
         return None
 
 
+def paper_meta_get_many(arxivids: list[str]) -> list[ATOMItem]:
+    atom_items = []
+    for start in range(0, len(arxivids), MAX_QUERY_PARAMS):
+        id_slice = arxivids[start: start + MAX_QUERY_PARAMS]
+        select_query = f"SELECT {PAPER_META_COLUMNS} FROM paper_meta WHERE arxivid IN ({','.join('?' * len(id_slice))})"
+        atom_items += [_row2atom(result) for result in conn.execute(select_query, id_slice)]
+    return atom_items
+
+
+def paper_meta_existing(arxivids: list[str]) -> set[str]:
+    existing = set()
+    for start in range(0, len(arxivids), MAX_QUERY_PARAMS):
+        id_slice = arxivids[start: start + MAX_QUERY_PARAMS]
+        select_query = f"SELECT arxivid FROM paper_meta WHERE arxivid IN ({','.join('?' * len(id_slice))})"
+        existing.update(result[0] for result in conn.execute(select_query, id_slice))
+    return existing
+
+
 def paper_meta_set(atom_item: ATOMItem, force: bool = False):
     check_query = 'SELECT arxivid FROM paper_meta WHERE arxivid = ?'
-    insert_replace_query = '''
-    INSERT OR REPLACE INTO paper_meta VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    upsert_query = f'''
+    {PAPER_META_INSERT}
+    ON CONFLICT(arxivid) DO UPDATE SET {PAPER_META_UPDATE}
     '''
 
     result = conn.execute(check_query, (atom_item.arxivid,)).fetchone()
     if result is not None and not force:
         return
-    conn.execute(insert_replace_query, (
+    conn.execute(upsert_query, _atom2row(atom_item))
+    _paper_index_set([atom_item], force=True)
+    _fts_refresh([atom_item.arxivid])
+
+
+def _paper_index_set(atom_items: list[ATOMItem], force: bool):
+    # keep paper_author / paper_category in step with paper_meta
+    if force:
+        conn.executemany("DELETE FROM paper_author WHERE arxivid = ?",
+                         ((atom_item.arxivid,) for atom_item in atom_items))
+        conn.executemany("DELETE FROM paper_category WHERE arxivid = ?",
+                         ((atom_item.arxivid,) for atom_item in atom_items))
+    conn.executemany("INSERT OR IGNORE INTO paper_author VALUES (?, ?, ?)", (
+        (atom_item.arxivid, position, name)
+        for atom_item in atom_items for position, name in enumerate(atom_item.author)))
+    conn.executemany("INSERT OR IGNORE INTO paper_category VALUES (?, ?, ?)", (
+        (atom_item.arxivid, category, int(category == atom_item.primary_category))
+        for atom_item in atom_items for category in dict.fromkeys([atom_item.primary_category, *atom_item.category])))
+
+
+def annotate(atom_item: ATOMItem) -> ATOMItem:
+    found = venue.annotate(atom_item.comment, atom_item.summary_clean)
+    atom_item.venue = None if found is None else found.label
+    atom_item.venue_rank = None if found is None else found.rank
+    return atom_item
+
+
+def _atom2row(atom_item: ATOMItem) -> tuple:
+    # the only place new papers enter the db, so text is normalized and venues matched here, once
+    normalize(atom_item)
+    annotate(atom_item)
+    return (
         atom_item.arxivid,
         atom_item.id,
         atom_item.updated,
         atom_item.published,
         atom_item.title,
         atom_item.summary,
-        ','.join(atom_item.author),
+        AUTHOR_SEP.join(atom_item.author),
         atom_item.comment,
         atom_item.link_abs,
         atom_item.link_pdf,
         ','.join(atom_item.category),
-        atom_item.primary_category
-    ))
+        atom_item.primary_category,
+        atom_item.title_clean,
+        atom_item.summary_clean,
+        utils.NORMALIZE_VERSION,
+        atom_item.venue,
+        atom_item.venue_rank,
+        venue.version()
+    )
+
+
+def paper_meta_set_many(atom_items: Iterable[ATOMItem], force: bool = False):
+    # one transaction and one prepared statement for the whole batch
+    upsert_query = f'''
+    {PAPER_META_INSERT}
+    ON CONFLICT(arxivid) DO {"UPDATE SET " + PAPER_META_UPDATE if force else "NOTHING"}
+    '''
+    atom_items = list(atom_items)
+    with conn:
+        conn.executemany(upsert_query, (_atom2row(atom_item) for atom_item in atom_items))
+        _paper_index_set(atom_items, force)
+        _fts_refresh([atom_item.arxivid for atom_item in atom_items])
+
+
+def backfill_get(category: str, window_start: str, window_end: str) -> tuple[int, int | None, bool] | None:
+    get_query = '''
+    SELECT next_start, total, done FROM backfill_progress
+    WHERE category = ? AND window_start = ? AND window_end = ?
+    '''
+    result = conn.execute(get_query, (category, window_start, window_end)).fetchone()
+    if result is None:
+        return None
+    next_start, total, done = result
+    return next_start, total, bool(done)
+
+
+def backfill_page_set(category: str, window_start: str, window_end: str, atom_items: list[ATOMItem],
+                      daily_items: list[MainLogItem], next_start: int, total: int | None, done: bool):
+    # a page and the checkpoint past it commit together, so a resumed run never skips or repeats a page
+    upsert_query = f'''
+    {PAPER_META_INSERT}
+    ON CONFLICT(arxivid) DO UPDATE SET {PAPER_META_UPDATE}
+    '''
+    daily_query = '''
+    INSERT INTO daily (arxivtime, arxivid, category) VALUES (?, ?, ?)
+    ON CONFLICT DO NOTHING
+    '''
+    progress_query = '''
+    INSERT INTO backfill_progress (category, window_start, window_end, next_start, total, done, updated)
+    VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
+    ON CONFLICT DO UPDATE SET
+    next_start = excluded.next_start, total = excluded.total, done = excluded.done, updated = excluded.updated
+    '''
+    with conn:
+        conn.executemany(upsert_query, (_atom2row(atom_item) for atom_item in atom_items))
+        _paper_index_set(atom_items, True)
+        _fts_refresh([atom_item.arxivid for atom_item in atom_items])
+        conn.executemany(daily_query, ((item.arxivtime, item.arxivid, item.category) for item in daily_items))
+        conn.execute(progress_query, (category, window_start, window_end, next_start, total, int(done)))
 
 
 def translation_get(arxivid):
@@ -123,39 +289,497 @@ def translation_set(translation: TransItem, force: bool = False):
         translation.title,
         translation.abs
     ))
+    _fts_refresh([translation.arxivid])
+
+
+def translation_set_many(translations: Iterable[TransItem], force: bool = False):
+    upsert_query = f'''
+    INSERT INTO translations VALUES (?, ?, ?)
+    ON CONFLICT(arxivid) DO {"UPDATE SET title = excluded.title, abs = excluded.abs" if force else "NOTHING"}
+    '''
+    translations = list(translations)
+    with conn:
+        conn.executemany(upsert_query, ((item.arxivid, item.title, item.abs) for item in translations))
+        _fts_refresh([item.arxivid for item in translations])
+
+
+def _fts_rowid(arxivid: str) -> int:
+    # fts rows are keyed by their arxivid, not by paper_meta's implicit rowid which VACUUM may renumber
+    return int.from_bytes(hashlib.blake2b(arxivid.encode(), digest_size=8).digest(), "big") >> 1
+
+
+def _fts_rows(rows: Iterable[tuple]) -> tuple[list[tuple], list[tuple]]:
+    # FTS_SELECT rows to paper_fts and paper_fts_zh rows, untranslated papers have none in the latter
+    rows = list(rows)
+    return ([(_fts_rowid(row[0]), *row[:4]) for row in rows],
+            [(_fts_rowid(row[0]), row[0], *row[4:]) for row in rows if row[4] is not None or row[5] is not None])
+
+
+def _fts_refresh(arxivids: list[str]):
+    # papers without meta are skipped
+    rowids = [(_fts_rowid(arxivid),) for arxivid in arxivids]
+    conn.executemany("DELETE FROM paper_fts WHERE rowid = ?", rowids)
+    conn.executemany("DELETE FROM paper_fts_zh WHERE rowid = ?", rowids)
+    for start in range(0, len(arxivids), MAX_QUERY_PARAMS):
+        id_slice = arxivids[start: start + MAX_QUERY_PARAMS]
+        fts_rows, fts_zh_rows = _fts_rows(conn.execute(
+            f"{FTS_SELECT} WHERE paper_meta.arxivid IN ({','.join('?' * len(id_slice))})", id_slice))
+        conn.executemany(f"INSERT INTO paper_fts (rowid, {FTS_COLUMNS}) VALUES (?, ?, ?, ?, ?)", fts_rows)
+        conn.executemany(f"INSERT INTO paper_fts_zh (rowid, {FTS_ZH_COLUMNS}) VALUES (?, ?, ?, ?)", fts_zh_rows)
+
+
+def _fts_match(table: str, weights: str, query: str, limit: int) -> list[tuple[str, float]]:
+    # `query` uses fts5 syntax, falling back to plain terms when it does not parse
+    match_query = f'''
+    SELECT arxivid, bm25({table}, {weights}) AS rank FROM {table} WHERE {table} MATCH ? ORDER BY rank LIMIT ?
+    '''
+    try:
+        return conn.execute(match_query, (query, limit)).fetchall()
+    except sqlite3.OperationalError:
+        terms = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+        return conn.execute(match_query, (terms, limit)).fetchall()
+
+
+def search(query: str, limit: int = 50) -> list[tuple[ATOMItem, TransItem | None, float]]:
+    # bm25 ranked over the english text and the translations, a paper found in both keeps its better rank.
+    # the trigram index only matches chinese terms of three or more characters
+    ranks: dict[str, float] = dict()
+    for table, weights in [("paper_fts", FTS_WEIGHTS), ("paper_fts_zh", FTS_ZH_WEIGHTS)]:
+        for arxivid, rank in _fts_match(table, weights, query, limit):
+            ranks[arxivid] = min(rank, ranks.get(arxivid, rank))
+    top = sorted(ranks, key=ranks.__getitem__)[:limit]
+    if len(top) == 0:
+        return []
+    get_query = f'''
+    SELECT {PAPER_META_COLUMNS}, translations.title, translations.abs
+    FROM paper_meta
+    LEFT JOIN translations ON translations.arxivid = paper_meta.arxivid
+    WHERE paper_meta.arxivid IN ({','.join('?' * len(top))})
+    '''
+    results = {result[0]: result for result in conn.execute(get_query, top)}
+    hits = []
+    for arxivid in top:
+        if arxivid not in results:
+            continue
+        result = results[arxivid]
+        atom_item = _row2atom(result[:PAPER_META_NCOLS])
+        trans = result[PAPER_META_NCOLS:PAPER_META_NCOLS + 2]
+        trans_item = None if trans == (None, None) else TransItem(atom_item.arxivid, *trans)
+        hits.append((atom_item, trans_item, ranks[arxivid]))
+    return hits
+
+
+def fragment_get_many(cache_keys: list[str]) -> dict[str, str]:
+    fragments = dict()
+    for start in range(0, len(cache_keys), MAX_QUERY_PARAMS):
+        key_slice = cache_keys[start: start + MAX_QUERY_PARAMS]
+        get_query = f"SELECT cache_key, html FROM render_cache WHERE cache_key IN ({','.join('?' * len(key_slice))})"
+        fragments.update(conn.execute(get_query, key_slice))
+    return fragments
+
+
+def fragment_set_many(fragments: list[tuple[str, str, str]]):
+    # (cache_key, arxivid, html); only the latest fragment of a paper is kept
+    with conn:
+        conn.executemany("DELETE FROM render_cache WHERE arxivid = ?",
+                         ((arxivid,) for _, arxivid, _ in fragments))
+        conn.executemany("INSERT OR REPLACE INTO render_cache VALUES (?, ?, ?)", fragments)
+
+
+def papers_by_author(name: str) -> list[ATOMItem]:
+    select_query = f'''
+    SELECT {PAPER_META_COLUMNS} FROM paper_meta WHERE arxivid IN (
+        SELECT arxivid FROM paper_author WHERE name = ? COLLATE NOCASE)
+    ORDER BY paper_meta.arxivid DESC
+    '''
+    return [_row2atom(result) for result in conn.execute(select_query, (name,))]
+
+
+def papers_by_category(category: str, primary_only: bool = False) -> list[ATOMItem]:
+    select_query = f'''
+    SELECT {PAPER_META_COLUMNS} FROM paper_meta WHERE arxivid IN (
+        SELECT arxivid FROM paper_category WHERE category = ? {"AND is_primary = 1" if primary_only else ""})
+    ORDER BY paper_meta.arxivid DESC
+    '''
+    return [_row2atom(result) for result in conn.execute(select_query, (category,))]
 
 
 def daily_set(item: MainLogItem):
-    insert_or_replace_query = '''
-    INSERT OR REPLACE INTO daily VALUES (?, ?, ?)
+    insert_query = '''
+    INSERT OR IGNORE INTO daily (arxivtime, arxivid, category) VALUES (?, ?, ?)
     '''
-    conn.execute(insert_or_replace_query, (
-        item.arxivid,
+    conn.execute(insert_query, (
         item.arxivtime,
+        item.arxivid,
         item.category
     ))
 
 
-def daily_get_by_arxivid(arxivid):
-    get_query = 'SELECT * FROM daily WHERE arxivid = ?'
-    result = conn.execute(get_query, (arxivid,)).fetchone()
-    if result:
-        return MainLogItem(*result)
-    else:
-        return None
+def daily_set_many(items: Iterable[MainLogItem]):
+    insert_query = '''
+    INSERT INTO daily (arxivtime, arxivid, category) VALUES (?, ?, ?)
+    ON CONFLICT DO NOTHING
+    '''
+    with conn:
+        conn.executemany(insert_query, ((item.arxivtime, item.arxivid, item.category) for item in items))
+
+
+def daily_get_by_arxivid(arxivid) -> list[MainLogItem]:
+    get_query = 'SELECT arxivid, arxivtime, category FROM daily WHERE arxivid = ? ORDER BY arxivtime'
+    results = conn.execute(get_query, (arxivid,)).fetchall()
+    return [MainLogItem(*result) for result in results]
 
 
-def daily_get_by_date(arxivtime: str):
-    get_query = 'SELECT * FROM daily WHERE arxivtime = ?'
-    results = conn.execute(get_query, (arxivtime,)).fetchall()
+def daily_logged(arxivtime: str, arxivids: list[str]) -> set[str]:
+    logged = set()
+    for start in range(0, len(arxivids), MAX_QUERY_PARAMS):
+        id_slice = arxivids[start: start + MAX_QUERY_PARAMS]
+        get_query = f"SELECT arxivid FROM daily WHERE arxivtime = ? AND arxivid IN ({','.join('?' * len(id_slice))})"
+        logged.update(result[0] for result in conn.execute(get_query, [arxivtime, *id_slice]))
+    return logged
+
+
+def daily_get_by_date(arxivtime: str, categories: list[str] | None = None) -> list[str]:
+    get_query = 'SELECT DISTINCT arxivid FROM daily WHERE arxivtime = ?'
+    params = [arxivtime]
+    if categories is not None:
+        get_query += f" AND category IN ({','.join('?' * len(categories))})"
+        params += categories
+    results = conn.execute(get_query, params).fetchall()
     return [result[0] for result in results]
 
 
-def init_db():
+def tune_db():
+    for pragma, value in TUNED_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+
+
+def history_iter(start: str, end: str,
+                 categories: list[str] | None = None) -> Iterator[tuple[str, ATOMItem, TransItem | None]]:
+    # papers logged in [start, end) with their cached translation, streamed off one JOIN.
+    # `categories` restricts to papers announced in those feeds
+    category_filter = ""
+    params = [start, end]
+    if categories is not None:
+        category_filter = f"AND daily.category IN ({','.join('?' * len(categories))})"
+        params += categories
+    history_query = f'''
+    SELECT daily.arxivtime, daily.arxivid, {PAPER_META_COLUMNS}, translations.title, translations.abs
+    FROM daily
+    LEFT JOIN paper_meta ON paper_meta.arxivid = daily.arxivid
+    LEFT JOIN translations ON translations.arxivid = daily.arxivid
+    WHERE daily.arxivtime >= ? AND daily.arxivtime < ? {category_filter}
+    GROUP BY substr(daily.arxivtime, 1, 10), daily.arxivid
+    ORDER BY substr(daily.arxivtime, 1, 10), daily.arxivid DESC
+    '''
+    for result in conn.execute(history_query, params):
+        arxivtime, arxivid = result[0], result[1]
+        meta, trans = result[2:2 + PAPER_META_NCOLS], result[2 + PAPER_META_NCOLS:]
+        if meta[0] is None:
+            logger.error(f"record not found {arxivid}")
+            continue
+        atom_item = _row2atom(meta)
+        trans_item = None if trans == (None, None) else TransItem(arxivid, *trans)
+        yield arxivtime, atom_item, trans_item
+
+
+def daily_dates(limit: int | None = None) -> list[tuple[str, int]]:
+    # (YYYY-MM-DD, papers logged) per announcement date, newest first
+    dates_query = '''
+    SELECT substr(arxivtime, 1, 10) AS date, COUNT(DISTINCT arxivid) FROM daily
+    GROUP BY date ORDER BY date DESC
+    '''
+    if limit is not None:
+        dates_query += f" LIMIT {int(limit)}"
+    return conn.execute(dates_query).fetchall()
+
+
+def translated_count(start: str, end: str, categories: list[str] | None = None) -> int:
+    category_filter = ""
+    params = [start, end]
+    if categories is not None:
+        category_filter = f"AND daily.category IN ({','.join('?' * len(categories))})"
+        params += categories
+    count_query = f'''
+    SELECT COUNT(DISTINCT daily.arxivid) FROM daily
+    JOIN translations ON translations.arxivid = daily.arxivid
+    WHERE daily.arxivtime >= ? AND daily.arxivtime < ? {category_filter}
+    '''
+    return conn.execute(count_query, params).fetchone()[0]
+
+
+def daily_fingerprint_iter() -> Iterator[tuple]:
+    # everything a rendered page depends on, per (date, category, paper); cheap columns only besides translations
+    fingerprint_query = '''
+    SELECT substr(daily.arxivtime, 1, 10) AS date, daily.category, daily.arxivid,
+           paper_meta.updated, paper_meta.norm_version, translations.title, translations.abs
+    FROM daily
+    LEFT JOIN paper_meta ON paper_meta.arxivid = daily.arxivid
+    LEFT JOIN translations ON translations.arxivid = daily.arxivid
+    ORDER BY date, daily.category, daily.arxivid
+    '''
+    yield from conn.execute(fingerprint_query)
+
+
+def data_version() -> int:
+    # changes whenever another connection commits, i.e. after an ingest from another process
+    return conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def _arxiv_iso(arxivtime: str | None) -> str | None:
+    try:
+        return utils.get_arxiv_time(arxivtime).isoformat()
+    except (AssertionError, ValueError):
+        return arxivtime
+
+
+def _arxiv_day(arxivtime: str) -> str:
+    try:
+        return utils.get_arxiv_day(arxivtime)
+    except (AssertionError, ValueError):
+        return arxivtime
+
+
+def _migrate_daily_composite_key():
+    # a paper may be announced on several days and in several feeds: key on all three,
+    # normalize the announce time to ISO 8601 and fill in the category we never wrote
+    conn.create_function("arxiv_iso", 1, _arxiv_iso, deterministic=True)
+    conn.execute('''
+    CREATE TABLE daily_new (
+        arxivtime TEXT NOT NULL,
+        arxivid VARCHAR(20) NOT NULL,
+        category VARCHAR(16) NOT NULL DEFAULT '',
+        PRIMARY KEY (arxivtime, arxivid, category)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    INSERT OR IGNORE INTO daily_new (arxivtime, arxivid, category)
+    SELECT arxiv_iso(daily.arxivtime), daily.arxivid, COALESCE(daily.category, paper_meta.primary_category, '')
+    FROM daily LEFT JOIN paper_meta ON paper_meta.arxivid = daily.arxivid
+    WHERE daily.arxivtime IS NOT NULL
+    ''')
+    conn.execute("DROP TABLE daily")
+    conn.execute("ALTER TABLE daily_new RENAME TO daily")
+    conn.execute("CREATE INDEX daily_arxivtime_category ON daily (arxivtime, category)")
+    conn.execute("CREATE INDEX daily_arxivid ON daily (arxivid)")
+
+
+def _migrate_paper_index():
+    conn.execute('''
+    CREATE TABLE paper_author (
+        arxivid VARCHAR(20) NOT NULL,
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        PRIMARY KEY (arxivid, position)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX paper_author_name ON paper_author (name COLLATE NOCASE)")
+    conn.execute('''
+    CREATE TABLE paper_category (
+        arxivid VARCHAR(20) NOT NULL,
+        category VARCHAR(16) NOT NULL,
+        is_primary INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (arxivid, category)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX paper_category_category ON paper_category (category, is_primary)")
+    # the comma-joined legacy columns are all we have for papers stored so far
+    rows = conn.execute("SELECT arxivid, author, category, primary_category FROM paper_meta").fetchall()
+    conn.executemany("INSERT OR IGNORE INTO paper_author VALUES (?, ?, ?)", (
+        (arxivid, position, name)
+        for arxivid, author, _, _ in rows if author for position, name in enumerate(author.split(','))))
+    conn.executemany("INSERT OR IGNORE INTO paper_category VALUES (?, ?, ?)", (
+        (arxivid, category, int(category == primary_category))
+        for arxivid, _, categories, primary_category in rows
+        for category in dict.fromkeys([primary_category, *(categories or "").split(',')]) if category))
+
+
+def _migrate_paper_fts():
+    conn.execute('''
+    CREATE VIRTUAL TABLE paper_fts USING fts5(
+        arxivid UNINDEXED, title, summary, comment, tr_title, tr_abs,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    ''')
+    conn.execute('''
+    INSERT INTO paper_fts (rowid, arxivid, title, summary, comment, tr_title, tr_abs)
+    SELECT paper_meta.rowid, paper_meta.arxivid, paper_meta.title, paper_meta.summary, paper_meta.comment,
+           translations.title, translations.abs
+    FROM paper_meta LEFT JOIN translations ON translations.arxivid = paper_meta.arxivid
+    ''')
+
+
+def _migrate_clean_text():
+    # filled in by `renormalize_db`, which picks up every row below NORMALIZE_VERSION
+    conn.execute("ALTER TABLE paper_meta ADD COLUMN title_clean TEXT")
+    conn.execute("ALTER TABLE paper_meta ADD COLUMN summary_clean TEXT")
+    conn.execute("ALTER TABLE paper_meta ADD COLUMN norm_version INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX paper_meta_norm_version ON paper_meta (norm_version)")
+
+
+def _migrate_render_cache():
+    conn.execute('''
+    CREATE TABLE render_cache (
+        cache_key TEXT PRIMARY KEY,
+        arxivid VARCHAR(20) NOT NULL,
+        html TEXT NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX render_cache_arxivid ON render_cache (arxivid)")
+
+
+def _migrate_backfill_progress():
+    conn.execute('''
+    CREATE TABLE backfill_progress (
+        category TEXT NOT NULL,
+        window_start TEXT NOT NULL,
+        window_end TEXT NOT NULL,
+        next_start INTEGER NOT NULL,
+        total INTEGER,
+        done INTEGER NOT NULL DEFAULT 0,
+        updated TEXT,
+        PRIMARY KEY (category, window_start, window_end)
+    ) WITHOUT ROWID
+    ''')
+
+
+def _migrate_paper_fts_zh():
+    # translations move to their own trigram table, both tables are keyed by `_fts_rowid(arxivid)`
+    conn.execute("DROP TABLE paper_fts")
+    conn.execute('''
+    CREATE VIRTUAL TABLE paper_fts USING fts5(
+        arxivid UNINDEXED, title, summary, comment,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    ''')
+    conn.execute('''
+    CREATE VIRTUAL TABLE paper_fts_zh USING fts5(
+        arxivid UNINDEXED, tr_title, tr_abs,
+        tokenize = 'trigram'
+    )
+    ''')
+    fts_rows, fts_zh_rows = _fts_rows(conn.execute('''
+    SELECT paper_meta.arxivid,
+           COALESCE(paper_meta.title_clean, paper_meta.title), COALESCE(paper_meta.summary_clean, paper_meta.summary),
+           paper_meta.comment,
+           translations.title, translations.abs
+    FROM paper_meta LEFT JOIN translations ON translations.arxivid = paper_meta.arxivid
+    '''))
+    conn.executemany("INSERT INTO paper_fts (rowid, arxivid, title, summary, comment) VALUES (?, ?, ?, ?, ?)",
+                     fts_rows)
+    conn.executemany("INSERT INTO paper_fts_zh (rowid, arxivid, tr_title, tr_abs) VALUES (?, ?, ?, ?)", fts_zh_rows)
+
+
+def _migrate_venue():
+    # filled in by `reannotate_db`, which picks up every row matched by another venue list or matcher
+    conn.execute("ALTER TABLE paper_meta ADD COLUMN venue TEXT")
+    conn.execute("ALTER TABLE paper_meta ADD COLUMN venue_rank TEXT")
+    conn.execute("ALTER TABLE paper_meta ADD COLUMN venue_version TEXT")
+    conn.execute("CREATE INDEX paper_meta_venue_version ON paper_meta (venue_version)")
+
+
+def _migrate_daily_day_key():
+    # announce times were converted to fixed EST, which files a summer mailing under the day before;
+    # key every row by `utils.get_arxiv_day` instead. rows that collide once rekeyed are duplicates
+    conn.create_function("arxiv_day", 1, _arxiv_day, deterministic=True)
+    conn.execute("UPDATE OR IGNORE daily SET arxivtime = arxiv_day(arxivtime)")
+    conn.execute("DELETE FROM daily WHERE arxivtime != arxiv_day(arxivtime)")
+
+
+def _migrate_author_order():
+    # authors were read back through group_concat, which does not promise paper_author's order;
+    # paper_meta.author is rewritten from paper_author in position order, joined by "\x1f"
+    authors: dict[str, list[str]] = dict()
+    for arxivid, name in conn.execute("SELECT arxivid, name FROM paper_author ORDER BY arxivid, position"):
+        authors.setdefault(arxivid, []).append(name)
+    conn.executemany("UPDATE paper_meta SET author = ? WHERE arxivid = ?",
+                     (("\x1f".join(names), arxivid) for arxivid, names in authors.items()))
+
+
+# MIGRATIONS[i] upgrades a db at schema version i (`PRAGMA user_version`) to i + 1.
+# `create_table_querys` is version 0; append new migrations, never edit old ones
+MIGRATIONS = [
+    _migrate_daily_composite_key,
+    _migrate_paper_index,
+    _migrate_paper_fts,
+    _migrate_clean_text,
+    _migrate_render_cache,
+    _migrate_backfill_progress,
+    _migrate_venue,
+    _migrate_paper_fts_zh,
+    _migrate_daily_day_key,
+    _migrate_author_order,
+]
+
+
+def migrate_db():
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target in range(version + 1, len(MIGRATIONS) + 1):
+        logger.info(f"Migrating db schema to version {target}")
+        conn.execute("BEGIN")
+        try:
+            MIGRATIONS[target - 1]()
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def renormalize_db(batch_size: int = 1000):
+    select_query = '''
+    SELECT arxivid, title, summary FROM paper_meta WHERE norm_version < ? LIMIT ?
+    '''
+    update_query = '''
+    UPDATE paper_meta SET title_clean = ?, summary_clean = ?, norm_version = ? WHERE arxivid = ?
+    '''
+    while True:
+        results = conn.execute(select_query, (utils.NORMALIZE_VERSION, batch_size)).fetchall()
+        if len(results) == 0:
+            return
+        logger.info(f"Normalizing {len(results)} stored papers to version {utils.NORMALIZE_VERSION}")
+        cleaned = list()
+        for arxivid, title, summary in results:
+            atom_item = normalize(ATOMItem(arxivid, None, None, title, summary, (), None, (), ""))
+            cleaned.append((atom_item.title_clean, atom_item.summary_clean, utils.NORMALIZE_VERSION, arxivid))
+        with conn:
+            conn.executemany(update_query, cleaned)
+            _fts_refresh([arxivid for arxivid, _, _ in results])
+
+
+def reannotate_db(batch_size: int = 1000):
+    select_query = '''
+    SELECT arxivid, comment, summary_clean FROM paper_meta
+    WHERE venue_version IS NULL OR venue_version != ? LIMIT ?
+    '''
+    update_query = '''
+    UPDATE paper_meta SET venue = ?, venue_rank = ?, venue_version = ? WHERE arxivid = ?
+    '''
+    version = venue.version()
+    while True:
+        results = conn.execute(select_query, (version, batch_size)).fetchall()
+        if len(results) == 0:
+            return
+        logger.info(f"Matching venues of {len(results)} stored papers")
+        annotated = list()
+        for arxivid, comment, summary in results:
+            found = venue.annotate(comment, summary)
+            annotated.append((None if found is None else found.label, None if found is None else found.rank,
+                              version, arxivid))
+        with conn:
+            conn.executemany(update_query, annotated)
+
+
+def init_db(tuned: bool = False):
     global conn
     conn = sqlite3.connect(DB_PATH)
+    if tuned:
+        tune_db()
     for create_table_query in create_table_querys:
         conn.execute(create_table_query)
+    migrate_db()
+    renormalize_db()
+    reannotate_db()
 
 
 def close_db():
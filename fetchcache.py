@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import os.path as path
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from urllib.parse import urlencode
+
+from config import FETCH_CACHE_MAX_BYTES, FETCH_CACHE_STORE, FETCH_CACHE_TTL
+from utils import logger
+
+INDEX_PATH = path.join(FETCH_CACHE_STORE, "index.db")
+
+create_table_querys = [
+    """CREATE TABLE IF NOT EXISTS blobs (
+        hash TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        raw_size INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY,
+        hash TEXT NOT NULL REFERENCES blobs(hash),
+        fetched REAL NOT NULL,
+        accessed REAL NOT NULL,
+        etag TEXT,
+        last_modified TEXT,
+        meta TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)",
+    "CREATE INDEX IF NOT EXISTS entries_hash ON entries(hash)",
+]
+
+
+@dataclass(slots=True)
+class CacheEntry:
+    key: str
+    content: bytes
+    fetched: float
+    etag: str | None
+    last_modified: str | None
+    meta: dict
+
+    def age(self) -> float:
+        return time.time() - self.fetched
+
+
+_conn: sqlite3.Connection | None = None
+_lock = threading.Lock()
+
+
+def _get_conn() -> sqlite3.Connection:
+    # fetches run on worker threads, so the index connection is shared behind a lock
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(INDEX_PATH, check_same_thread=False, isolation_level=None)
+        for create_table_query in create_table_querys:
+            _conn.execute(create_table_query)
+    return _conn
+
+
+def cache_key(url: str, params: dict | None = None) -> str:
+    if not params:
+        return url
+    return url + "?" + urlencode(sorted((k, str(v)) for k, v in params.items()))
+
+
+def _blob_path(blob_hash: str) -> str:
+    return path.join(FETCH_CACHE_STORE, blob_hash[:2], blob_hash + ".z")
+
+
+def get(url: str, params: dict | None = None, ttl: float | None = FETCH_CACHE_TTL) -> CacheEntry | None:
+    # entries older than `ttl` seconds are treated as missing, `ttl=None` accepts any age
+    key = cache_key(url, params)
+    with _lock:
+        conn = _get_conn()
+        row = conn.execute("SELECT hash, fetched, etag, last_modified, meta FROM entries WHERE key = ?",
+                           (key,)).fetchone()
+        if row is None:
+            return None
+        blob_hash, fetched, etag, last_modified, meta = row
+        if ttl is not None and time.time() - fetched > ttl:
+            return None
+        try:
+            with open(_blob_path(blob_hash), "rb") as f:
+                content = zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            logger.warning(f"fetch cache blob for `{key}` is unreadable, dropping it")
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+    return CacheEntry(key, content, fetched, etag, last_modified, json.loads(meta or "{}"))
+
+
+def put(url: str, params: dict | None, content: bytes, etag: str | None = None,
+        last_modified: str | None = None, meta: dict | None = None):
+    key = cache_key(url, params)
+    blob_hash = hashlib.sha256(content).hexdigest()
+    blob_path = _blob_path(blob_hash)
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        previous = conn.execute("SELECT hash FROM entries WHERE key = ?", (key,)).fetchone()
+        if conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (blob_hash,)).fetchone() is None \
+                or not path.exists(blob_path):
+            compressed = zlib.compress(content, 6)
+            os.makedirs(path.dirname(blob_path), exist_ok=True)
+            with open(blob_path + ".tmp", "wb") as f:
+                f.write(compressed)
+            os.replace(blob_path + ".tmp", blob_path)
+            conn.execute("INSERT OR REPLACE INTO blobs (hash, size, raw_size) VALUES (?, ?, ?)",
+                         (blob_hash, len(compressed), len(content)))
+        conn.execute("""INSERT INTO entries (key, hash, fetched, accessed, etag, last_modified, meta)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(key) DO UPDATE SET
+                        hash = excluded.hash, fetched = excluded.fetched, accessed = excluded.accessed,
+                        etag = excluded.etag, last_modified = excluded.last_modified, meta = excluded.meta""",
+                     (key, blob_hash, now, now, etag, last_modified, json.dumps(meta or {})))
+        # an overwritten key, e.g. an RSS url after a new announcement, leaves its old blob behind
+        if previous is not None and previous[0] != blob_hash \
+                and conn.execute("SELECT 1 FROM entries WHERE hash = ?", previous).fetchone() is None:
+            _drop_blob(conn, previous[0])
+        _evict(conn, FETCH_CACHE_MAX_BYTES)
+
+
+def touch(url: str, params: dict | None = None):
+    # a 304 revalidated the entry, so it counts as freshly fetched
+    now = time.time()
+    with _lock:
+        _get_conn().execute("UPDATE entries SET fetched = ?, accessed = ? WHERE key = ?",
+                            (now, now, cache_key(url, params)))
+
+
+def _drop_blob(conn: sqlite3.Connection, blob_hash: str):
+    try:
+        os.remove(_blob_path(blob_hash))
+    except FileNotFoundError:
+        pass
+    conn.execute("DELETE FROM blobs WHERE hash = ?", (blob_hash,))
+
+
+def _drop_orphans(conn: sqlite3.Connection) -> int:
+    orphans = [row[0] for row in conn.execute(
+        "SELECT hash FROM blobs WHERE hash NOT IN (SELECT hash FROM entries)")]
+    for blob_hash in orphans:
+        _drop_blob(conn, blob_hash)
+    return len(orphans)
+
+
+def _total_size(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+
+def _evict(conn: sqlite3.Connection, max_bytes: int) -> int:
+    # least recently used entries go first until the unique blobs fit under `max_bytes`.
+    # unreferenced blobs count towards the total without any entry to evict for them, so they go before any entry
+    total = _total_size(conn)
+    if total <= max_bytes:
+        return 0
+    if _drop_orphans(conn) != 0:
+        total = _total_size(conn)
+        if total <= max_bytes:
+            return 0
+    evicted = 0
+    for key, blob_hash in conn.execute("SELECT key, hash FROM entries ORDER BY accessed").fetchall():
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        evicted += 1
+        if conn.execute("SELECT 1 FROM entries WHERE hash = ?", (blob_hash,)).fetchone() is None:
+            total -= conn.execute("SELECT size FROM blobs WHERE hash = ?", (blob_hash,)).fetchone()[0]
+            _drop_blob(conn, blob_hash)
+        if total <= max_bytes:
+            break
+    return evicted
+
+
+def prune(ttl: float | None = FETCH_CACHE_TTL, max_bytes: int = FETCH_CACHE_MAX_BYTES) -> dict[str, int]:
+    with _lock:
+        conn = _get_conn()
+        expired = 0
+        if ttl is not None:
+            expired = conn.execute("DELETE FROM entries WHERE fetched < ?", (time.time() - ttl,)).rowcount
+        blobs = _drop_orphans(conn)
+        evicted = _evict(conn, max_bytes)
+    return {"expired": expired, "evicted": evicted, "blobs_removed": blobs}
+
+
+def stats() -> dict[str, int | float | None]:
+    with _lock:
+        conn = _get_conn()
+        entries, oldest, newest = conn.execute(
+            "SELECT COUNT(*), MIN(fetched), MAX(fetched) FROM entries").fetchone()
+        blobs, size, raw_size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(raw_size), 0) FROM blobs").fetchone()
+    return {"entries": entries, "blobs": blobs, "bytes": size, "raw_bytes": raw_size,
+            "max_bytes": FETCH_CACHE_MAX_BYTES, "oldest": oldest, "newest": newest}
+
+
+def command(args):
+    if args.cache_command == "stats":
+        cache_stats = stats()
+        for name in ["oldest", "newest"]:
+            if cache_stats[name] is not None:
+                cache_stats[name] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(cache_stats[name]))
+        for name, value in cache_stats.items():
+            print(f"{name:>10}: {value}")
+    elif args.cache_command == "prune":
+        ttl = args.ttl_days * 86400 if args.ttl_days is not None else FETCH_CACHE_TTL
+        max_bytes = int(args.max_mb * 1024 * 1024) if args.max_mb is not None else FETCH_CACHE_MAX_BYTES
+        result = prune(ttl, max_bytes)
+        logger.info("pruned {expired} expired and {evicted} evicted entries, {blobs_removed} blobs removed"
+                    .format(**result))
+
+
+def add_arguments(cache_parser):
+    cache_subparsers = cache_parser.add_subparsers(dest="cache_command", required=True)
+    cache_subparsers.add_parser("stats", help="entries, blobs and size of the fetch cache")
+    prune_parser = cache_subparsers.add_parser("prune", help="drop expired entries and evict down to the size cap")
+    prune_parser.add_argument("--ttl-days", type=float)
+    prune_parser.add_argument("--max-mb", type=float)
@@ -0,0 +1,59 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import HTTP_POOL_SIZE, HTTP_TIMEOUT
+from utils import logger
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    # one keep-alive session shared by every fetch and translate path
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    # a stalled connection must not hang the daemon, requests itself never times out
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    return get_session().get(url, **kwargs)
+
+
+def connection_stats() -> dict[str, dict[str, int]]:
+    """Requests sent and connections opened per host since the session was created."""
+    stats = dict()
+    if _session is None:
+        return stats
+    for adapter in set(_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            host = f"{pool.scheme}://{pool.host}"
+            requests_sent = stats.get(host, {}).get("requests", 0) + pool.num_requests
+            connections = stats.get(host, {}).get("connections", 0) + pool.num_connections
+            stats[host] = {"requests": requests_sent, "connections": connections,
+                           "reused": requests_sent - connections}
+    return stats
+
+
+def log_stats():
+    for host, stat in connection_stats().items():
+        logger.info("%s: %d requests over %d connections (%d reused)",
+                    host, stat["requests"], stat["connections"], stat["reused"])
+
+
+def close():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,142 @@
+import hashlib
+import html
+from typing import TextIO
+
+import arxivcategory
+import db
+import utils
+from arxivdata import ATOMItem
+from utils import logger
+from watchlist import Watchlist, highlight
+
+# bump when the fragment markup changes, cached fragments are keyed on it
+RENDER_VERSION = 2
+
+
+def fragment_key(item: ATOMItem, translations: tuple[str | None, str | None], watch: Watchlist | None = None) -> str:
+    # (arxivid, updated, translation hash), plus whatever else changes the markup
+    tr_title, tr_abs = translations
+    tr_hash = hashlib.sha1(f"{tr_title}\0{tr_abs}".encode()).hexdigest()
+    watch_key = "" if watch is None else f"{watch.version}.{item.relevance:g}"
+    return (f"{item.arxivid}|{item.updated}|{tr_hash}|{item.venue}.{item.venue_rank}|{watch_key}|"
+            f"{utils.NORMALIZE_VERSION}.{RENDER_VERSION}")
+
+
+def ATOM2HTML(metadata: ATOMItem, translations: tuple[str | None, str | None] = (None, None),
+              watch: Watchlist | None = None) -> str:
+    tr_title, tr_abs = translations
+    tr_title = tr_title or "这是标题"
+    tr_abs = tr_abs or "这是摘要"
+    e = html.escape
+
+    def mark(text: str) -> str:
+        return f"<mark>{e(text)}</mark>"
+
+    published = f" (Published @{e(metadata.published)})" if metadata.is_update() else ""
+    venue_line = f"Venue: <strong>{e(metadata.venue)}</strong> (CCF-{e(metadata.venue_rank)})<br />\n" if metadata.venue else ""
+    abstract = "\n".join(f"<p>{highlight(watch, paragraph, mark, e)}</p>"
+                         for paragraph in metadata.summary_clean.split("\n\n"))
+    relevance_line = ""
+    if metadata.relevance > 0:
+        relevance_line = f"Relevance: <strong>{metadata.relevance:g}</strong> ({e(', '.join(metadata.watch_hits))})<br />\n"
+    tr_abstract = "\n".join(f"<p>{e(paragraph)}</p>" for paragraph in tr_abs.split("\n\n"))
+
+    return f"""\
+<h3 id="{e(metadata.arxivid)}">{highlight(watch, metadata.title_clean, mark, e)}</h3>
+<blockquote>
+<p><strong>{e(tr_title)}</strong><br />
+Link: <a href="{e(metadata.link_abs)}">{e(metadata.arxivid)}</a><br />
+Comments: {e(str(metadata.comment))}<br />
+{venue_line}{relevance_line}Category: <strong>{e(metadata.primary_category)}</strong>, {e(", ".join(metadata.category))}<br />
+Authors: {e(", ".join(metadata.author))}<br />
+Date: {e(metadata.updated)}{published}</p>
+</blockquote>
+<p><strong>摘要:</strong></p>
+{tr_abstract}
+<p><strong>Abstract:</strong></p>
+{abstract}
+"""
+
+
+def load_day(start: str, end: str, categories: list[str] | None = None
+             ) -> tuple[str | None, list[ATOMItem], dict[str, tuple[str | None, str | None]]]:
+    # (arxivtime, papers, translations) logged in [start, end), ready for `write_html`
+    arxivtime = None
+    atom_items = []
+    translations = dict()
+    for arxivtime, atom_item, trans_item in db.history_iter(start, end, categories):
+        atom_items.append(atom_item)
+        translations[atom_item.arxivid] = (None, None) if trans_item is None else (trans_item.title, trans_item.abs)
+    return arxivtime, atom_items, translations
+
+
+def _cate_anchor(cate: str) -> str:
+    return "cate-" + cate.replace(".", "-")
+
+
+def render_toc(cate2item: dict[str, list[ATOMItem]], tag: str) -> str:
+    e = html.escape
+    lines = ['<div class="toc">', "<ul>", f'<li><a href="#feed">Arxiv Feed [{e(tag)}]</a>', "<ul>"]
+    for cate in cate2item:
+        lines.append(f'<li><a href="#{_cate_anchor(cate)}">{e(cate)}, {e(arxivcategory.ALL_CATEGORY[cate])}</a>')
+        lines.append("<ul>")
+        lines += [f'<li><a href="#{e(item.arxivid)}">{e(item.title_clean)}</a></li>' for item in cate2item[cate]]
+        lines.append("</ul>")
+        lines.append("</li>")
+    lines += ["</ul>", "</li>", "</ul>", "</div>", ""]
+    return "\n".join(lines)
+
+
+def write_html(f: TextIO, cate2item: dict[str, list[ATOMItem]], skip2item: dict[str, list[ATOMItem]],
+               translations: dict[str, tuple[str | None, str | None]],
+               tag: str, pubtime: str, fetchtime: str, style_link: str, watch: Watchlist | None = None):
+    # streams the page straight into `f`; paper fragments come from the db cache when unchanged
+    e = html.escape
+    items = [item for cate in cate2item for item in cate2item[cate]]
+    keys = {item.arxivid: fragment_key(item, translations[item.arxivid], watch) for item in items}
+    fragments = db.fragment_get_many(list(keys.values()))
+    logger.info(f"{len(fragments)}/{len(items)} paper fragments reused from cache")
+
+    f.write(f"""\
+<!DOCTYPE html>
+<html>
+  <head>
+    <meta charset="UTF-8">
+    <title>Arxiv Feed for {e(tag)}</title>
+    <link type="text/css" rel="stylesheet" href="{e(style_link)}">
+  </head>
+  <body>
+""")
+    f.write(render_toc(cate2item, tag))
+    f.write(f"""\
+<div id="write">
+<h1 id="feed">Arxiv Feed [{e(tag)}]</h1>
+<blockquote>
+<p>Published @ {e(pubtime)}<br />
+Fetched @ {e(fetchtime)}</p>
+</blockquote>
+""")
+    rendered = list()
+    for cate in cate2item:
+        f.write(f"""\
+<h2 id="{_cate_anchor(cate)}">{e(cate)}, {e(arxivcategory.ALL_CATEGORY[cate])}</h2>
+<blockquote>
+<p>{len(cate2item[cate])} papers today</p>
+</blockquote>
+""")
+        for item in cate2item[cate]:
+            key = keys[item.arxivid]
+            fragment = fragments.get(key)
+            if fragment is None:
+                fragment = ATOM2HTML(item, translations[item.arxivid], watch)
+                rendered.append((key, item.arxivid, fragment))
+            f.write(fragment)
+    for cate in skip2item:
+        skips = [item.arxivid for item in skip2item[cate]]
+        f.write(f"<blockquote><p>SKIP {e(cate)} {e(','.join(skips))}</p></blockquote>\n")
+    f.write("""\
+</div>
+  </body>
+</html>
+""")
+    db.fragment_set_many(rendered)
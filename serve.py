@@ -0,0 +1,176 @@
+import datetime
+import hashlib
+import html
+import io
+import mimetypes
+import os.path as path
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Callable
+from urllib.parse import unquote, urlparse
+
+import arxivcategory
+import db
+import render
+import watchlist
+from config import SERVE_CACHE_BYTES
+from utils import logger
+
+STATIC_ROOT = path.join(path.dirname(path.abspath(__file__)), "static")
+STYLE_LINK = "/static/cement/cement.css"
+
+
+class PageCache:
+    # rendered pages by key, evicted least recently used first once `max_bytes` is exceeded
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.pages: OrderedDict[tuple, tuple[bytes, str]] = OrderedDict()
+
+    def get(self, key: tuple) -> tuple[bytes, str] | None:
+        page = self.pages.get(key)
+        if page is not None:
+            self.pages.move_to_end(key)
+        return page
+
+    def put(self, key: tuple, body: bytes) -> tuple[bytes, str]:
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if key in self.pages:
+            self.size -= len(self.pages.pop(key)[0])
+        self.pages[key] = (body, etag)
+        self.size += len(body)
+        while self.size > self.max_bytes and len(self.pages) > 1:
+            _, (evicted, _) = self.pages.popitem(last=False)
+            self.size -= len(evicted)
+        return body, etag
+
+    def clear(self):
+        self.pages.clear()
+        self.size = 0
+
+
+class FeedServer(HTTPServer):
+    # single threaded on purpose, the db connection belongs to this thread
+    def __init__(self, address, split_feed: Callable, args):
+        super().__init__(address, FeedHandler)
+        self.split_feed = split_feed
+        self.args = args
+        self.cache = PageCache(SERVE_CACHE_BYTES)
+        self.data_version = db.data_version()
+
+    def check_ingest(self):
+        data_version = db.data_version()
+        if data_version != self.data_version:
+            logger.info("db changed, dropping rendered pages")
+            self.data_version = data_version
+            self.cache.clear()
+
+
+def parse_date(date: str) -> tuple[str, str]:
+    day = datetime.datetime.strptime(date, "%Y%m%d").date()
+    return day.isoformat(), (day + datetime.timedelta(days=1)).isoformat()
+
+
+def render_page(server: FeedServer, date: str, tag: str, categories: list[str]) -> bytes | None:
+    arxivtime, atom_items, translations = render.load_day(*parse_date(date), categories)
+    if len(atom_items) == 0:
+        return None
+    cate2item, skip2item = server.split_feed(atom_items, server.args, categories)
+    fetchtime = datetime.datetime.now().astimezone().strftime("%Y-%m-%d %H:%M %Z")
+    page = io.StringIO()
+    render.write_html(page, cate2item, skip2item, translations, tag, arxivtime, fetchtime, STYLE_LINK,
+                      watchlist.load(server.args.watchlist))
+    return page.getvalue().encode("utf-8", errors="xmlcharrefreplace")
+
+
+def render_index(collections: list[str]) -> bytes:
+    e = html.escape
+    lines = ["<!DOCTYPE html>", "<html>", "<head>", '<meta charset="UTF-8">', "<title>Arxiv Feed</title>",
+             f'<link type="text/css" rel="stylesheet" href="{STYLE_LINK}">', "</head>", "<body>",
+             '<div id="write">', "<h1>Arxiv Feed</h1>", "<ul>"]
+    for date, count in db.daily_dates():
+        day = date.replace("-", "")
+        links = ", ".join(f'<a href="/{day}/{e(collection)}">{e(collection)}</a>' for collection in collections)
+        lines.append(f"<li>{e(date)} ({count} papers): {links}</li>")
+    lines += ["</ul>", "</div>", "</body>", "</html>", ""]
+    return "\n".join(lines).encode("utf-8")
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    server: FeedServer
+
+    def do_GET(self):
+        parts = [unquote(part) for part in urlparse(self.path).path.split("/") if part != ""]
+        try:
+            if len(parts) != 0 and parts[0] == "static":
+                return self.send_static(parts[1:])
+            self.server.check_ingest()
+            if len(parts) == 0:
+                return self.send_body(render_index(list(arxivcategory.COLLECTIONS)), "text/html; charset=utf-8")
+            if len(parts) == 2 and parts[1] in arxivcategory.COLLECTIONS:
+                date, tag = parts
+                categories = arxivcategory.COLLECTIONS[tag]
+            elif len(parts) == 3 and parts[1] == "cat" and parts[2] in arxivcategory.ALL_CATEGORY:
+                date, _, tag = parts
+                categories = [tag]
+            else:
+                return self.send_error(HTTPStatus.NOT_FOUND)
+            start, end = parse_date(date)
+        except ValueError:
+            return self.send_error(HTTPStatus.NOT_FOUND)
+
+        # a translation landing for one of the page's papers or a watchlist edit changes the key,
+        # new ingests clear everything
+        watch = watchlist.load(self.server.args.watchlist)
+        key = (date, tag, db.translated_count(start, end, categories), None if watch is None else watch.version)
+        page = self.server.cache.get(key)
+        if page is None:
+            body = render_page(self.server, date, tag, categories)
+            if body is None:
+                return self.send_error(HTTPStatus.NOT_FOUND, f"nothing logged for {tag} on {date}")
+            page = self.server.cache.put(key, body)
+        body, etag = page
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_body(body, "text/html; charset=utf-8", etag)
+
+    def send_static(self, parts: list[str]):
+        filepath = path.normpath(path.join(STATIC_ROOT, *parts))
+        if not filepath.startswith(STATIC_ROOT + path.sep) or not path.isfile(filepath):
+            return self.send_error(HTTPStatus.NOT_FOUND)
+        with open(filepath, "rb") as f:
+            body = f.read()
+        self.send_body(body, mimetypes.guess_type(filepath)[0] or "application/octet-stream")
+
+    def send_body(self, body: bytes, content_type: str, etag: str | None = None):
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+def run(args, split_feed: Callable):
+    server = FeedServer((args.host, args.port), split_feed, args)
+    logger.info(f"Serving feeds on http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def add_arguments(serve_parser):
+    serve_parser.add_argument("--host", type=str, default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000)
@@ -0,0 +1,158 @@
+import datetime
+import hashlib
+import html
+import json
+import os
+import os.path as path
+import shutil
+from collections import defaultdict
+from typing import Callable
+
+import arxivcategory
+import db
+import render
+import utils
+import venue
+import watchlist
+from config import SITE_ROOT
+from utils import logger
+
+STATIC_ROOT = path.join(path.dirname(path.abspath(__file__)), "static")
+MANIFEST = "manifest.json"
+
+
+def day_digests() -> tuple[dict[str, dict[str, str]], dict[str, dict[str, int]]]:
+    # date -> category -> digest of every input its pages render from, and the paper counts per category
+    digests = defaultdict(dict)
+    counts: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for date, category, *row in db.daily_fingerprint_iter():
+        digest = digests[date].get(category)
+        if digest is None:
+            digest = digests[date][category] = hashlib.sha1()
+        digest.update(json.dumps(row, ensure_ascii=False).encode())
+        counts[date][category] += 1
+    return ({date: {category: digest.hexdigest() for category, digest in categories.items()}
+             for date, categories in digests.items()}, counts)
+
+
+def page_digest(category_digests: dict[str, str], categories: list[str], options: str) -> str | None:
+    parts = [f"{category}={category_digests[category]}" for category in categories if category in category_digests]
+    if len(parts) == 0:
+        return None
+    return hashlib.sha1("\n".join(parts + [options]).encode()).hexdigest()
+
+
+def write_if_changed(site_root: str, relpath: str, digest: str, manifest: dict[str, str],
+                     write: Callable[[str], None]) -> bool:
+    filepath = path.join(site_root, relpath)
+    if manifest.get(relpath) == digest and path.exists(filepath):
+        return False
+    os.makedirs(path.dirname(filepath), exist_ok=True)
+    write(filepath)
+    manifest[relpath] = digest
+    return True
+
+
+def write_day(filepath: str, date: str, tag: str, categories: list[str], split_feed: Callable, args,
+              style_link: str):
+    day = datetime.date.fromisoformat(date)
+    arxivtime, atom_items, translations = render.load_day(
+        day.isoformat(), (day + datetime.timedelta(days=1)).isoformat(), categories)
+    cate2item, skip2item = split_feed(atom_items, args, categories)
+    fetchtime = datetime.datetime.now().astimezone().strftime("%Y-%m-%d %H:%M %Z")
+    with open(filepath, "w", encoding="utf-8", errors="xmlcharrefreplace") as f:
+        render.write_html(f, cate2item, skip2item, translations, tag, arxivtime, fetchtime, style_link,
+                          watchlist.load(args.watchlist))
+
+
+def index_html(title: str, style_link: str, items: list[tuple[str, str]]) -> str:
+    e = html.escape
+    lines = ["<!DOCTYPE html>", "<html>", "<head>", '<meta charset="UTF-8">', f"<title>{e(title)}</title>",
+             f'<link type="text/css" rel="stylesheet" href="{e(style_link)}">', "</head>", "<body>",
+             '<div id="write">', f"<h1>{e(title)}</h1>", "<ul>"]
+    lines += [f'<li><a href="{e(href)}">{e(text)}</a></li>' for href, text in items]
+    lines += ["</ul>", "</div>", "</body>", "</html>", ""]
+    return "\n".join(lines)
+
+
+def write_index(site_root: str, relpath: str, manifest: dict[str, str], content: str) -> bool:
+    def write(filepath: str):
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write(content)
+    return write_if_changed(site_root, relpath, hashlib.sha1(content.encode()).hexdigest(), manifest, write)
+
+
+def copy_static(site_root: str):
+    for dirpath, _, filenames in os.walk(STATIC_ROOT):
+        for filename in filenames:
+            source = path.join(dirpath, filename)
+            target = path.join(site_root, "static", path.relpath(source, STATIC_ROOT))
+            if not path.exists(target) or path.getmtime(target) < path.getmtime(source):
+                os.makedirs(path.dirname(target), exist_ok=True)
+                shutil.copy2(source, target)
+
+
+def build(args, split_feed: Callable):
+    site_root = args.out
+    os.makedirs(site_root, exist_ok=True)
+    manifest_path = path.join(site_root, MANIFEST)
+    manifest: dict[str, str] = dict()
+    if path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    copy_static(site_root)
+
+    # anything that changes the markup without changing the db is folded into every page digest
+    options = (f"{render.RENDER_VERSION}.{utils.NORMALIZE_VERSION}|{venue.version()}|strict={args.strict}"
+               f"|onlynew={args.onlynew}|min_rank={args.min_rank}|rank_sort={args.rank_sort}"
+               f"|watchlist={getattr(watchlist.load(args.watchlist), 'version', None)}")
+    digests, counts = day_digests()
+    dates = sorted(digests, reverse=True)
+    rendered = 0
+    try:
+        collection_dates: dict[str, list[tuple[str, str]]] = defaultdict(list)
+        category_dates: dict[str, list[tuple[str, str]]] = defaultdict(list)
+        for date in dates:
+            day = date.replace("-", "")
+            for collection, categories in arxivcategory.COLLECTIONS.items():
+                digest = page_digest(digests[date], categories, options)
+                if digest is None:
+                    continue
+                count = sum(counts[date][category] for category in categories)
+                collection_dates[collection].append((f"{day}.html", f"{date} ({count} listings)"))
+                rendered += write_if_changed(
+                    site_root, f"{collection}/{day}.html", digest, manifest,
+                    lambda filepath: write_day(filepath, date, collection, categories, split_feed, args,
+                                               "../static/cement/cement.css"))
+            for category in digests[date]:
+                if category not in arxivcategory.ALL_CATEGORY:
+                    continue
+                category_dates[category].append((f"{day}.html", f"{date} ({counts[date][category]} papers)"))
+                rendered += write_if_changed(
+                    site_root, f"cat/{category}/{day}.html", page_digest(digests[date], [category], options),
+                    manifest, lambda filepath: write_day(filepath, date, category, [category], split_feed, args,
+                                                         "../../static/cement/cement.css"))
+
+        for collection, items in collection_dates.items():
+            rendered += write_index(site_root, f"{collection}/index.html", manifest,
+                                    index_html(f"Arxiv Feed [{collection}]", "../static/cement/cement.css", items))
+        for category, items in category_dates.items():
+            title = f"Arxiv Feed [{category}, {arxivcategory.ALL_CATEGORY[category]}]"
+            rendered += write_index(site_root, f"cat/{category}/index.html", manifest,
+                                    index_html(title, "../../static/cement/cement.css", items))
+        items = [(f"{collection}/index.html", f"{collection} ({len(collection_dates[collection])} dates)")
+                 for collection in arxivcategory.COLLECTIONS if collection in collection_dates]
+        items += [(f"cat/{category}/index.html", f"{category}, {arxivcategory.ALL_CATEGORY[category]}")
+                  for category in sorted(category_dates)]
+        rendered += write_index(site_root, "index.html", manifest,
+                                index_html("Arxiv Feed", "static/cement/cement.css", items))
+    finally:
+        # saved even when interrupted, so finished pages are not rendered again
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(manifest_path + ".tmp", manifest_path)
+    logger.info(f"Site built in `{site_root}`: {rendered} pages written, {len(manifest) - rendered} unchanged")
+
+
+def add_arguments(site_parser):
+    site_parser.add_argument("--out", type=str, default=SITE_ROOT, help="directory the archive is written to")
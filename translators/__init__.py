@@ -1,3 +1,7 @@
+from utils import TokenBucket
+
+from . import google_translate as _google
+from . import tencent_translate as _tencent
 from .google_translate import translate as google_translate
 from .tencent_translate import translate as tencent_translate
 
@@ -6,5 +10,42 @@ SERVICES = {
   "tencent": tencent_translate
 }
 
+BATCH_SERVICES = {
+  "google": _google.translate_many,
+  "tencent": _tencent.translate_many
+}
+
+CHUNKERS = {
+  "google": _google.chunk,
+  "tencent": _tencent.chunk
+}
+
+# (requests per second, burst) allowed for each service
+RATE_LIMITS = {
+  "google": (4, 4),
+  "tencent": (5, 5)
+}
+
+LIMITERS = {service: TokenBucket(*RATE_LIMITS[service]) for service in SERVICES}
+
+
 def translate(src: str, service: str = "google"):
-    return SERVICES[service](src)
\ No newline at end of file
+    LIMITERS[service].acquire()
+    return SERVICES[service](src)
+
+
+def chunk(texts: list[str], service: str = "google") -> list[list[int]]:
+    """Group indices of `texts` so that each group is a single backend request."""
+    return CHUNKERS[service](texts)
+
+
+def translate_many(texts: list[str], service: str = "google") -> list[str | None]:
+    results: list[str | None] = [None] * len(texts)
+    for idx in chunk(texts, service):
+        LIMITERS[service].acquire()
+        part = BATCH_SERVICES[service]([texts[i] for i in idx])
+        if part is None:
+            part = [translate(texts[i], service) for i in idx]
+        for i, result in zip(idx, part):
+            results[i] = result
+    return results
@@ -0,0 +1,17 @@
+def chunk_texts(texts: list[str], max_chars: int, sep_len: int = 0, max_items: int | None = None) -> list[list[int]]:
+    # greedily group indices of `texts` so each group fits in one backend request;
+    # a text longer than `max_chars` still gets a group of its own
+    chunks: list[list[int]] = list()
+    chunk: list[int] = list()
+    size = 0
+    for idx, text in enumerate(texts):
+        cost = len(text) + (sep_len if len(chunk) != 0 else 0)
+        full = max_items is not None and len(chunk) >= max_items
+        if len(chunk) != 0 and (size + cost > max_chars or full):
+            chunks.append(chunk)
+            chunk, size, cost = list(), 0, len(text)
+        chunk.append(idx)
+        size += cost
+    if len(chunk) != 0:
+        chunks.append(chunk)
+    return chunks
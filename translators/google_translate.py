@@ -1,7 +1,18 @@
+import re
 import urllib.parse
-import requests
+
+import httpclient
+
+from .batching import chunk_texts
 
 GOOGLE_TRANSLATE_URL = "https://translate.google.com"
+# texts are packed into the `q` query parameter, keep the URL reasonably short
+BATCH_CHARS = 4000
+# single-line texts (titles) are joined by newlines, which google keeps verbatim;
+# multi-line texts (abstracts) need a marker that survives translation
+LINE_DELIM = "\n"
+BLOCK_DELIM = "\n\n###\n\n"
+_BLOCK_SPLIT = re.compile(r"\s*#{3}\s*")
 
 
 def RL(a, b):
@@ -65,7 +76,7 @@ def translate(data: str):
     param = f"sl={langfrom}&tl={langto}"
     tk = TL(data)
     q = urllib.parse.quote(data)
-    resp = requests.get(
+    resp = httpclient.get(
         f"{GOOGLE_TRANSLATE_URL}/translate_a/single?client=gtx&{param}&hl=zh-CN&dt=at&dt=bd&dt=ex&dt=ld&dt=md&dt=qca&dt=rw&dt=rm&dt=ss&dt=t&source=bh&ssel=0&tsel=0&kc=1&tk={tk}&q={q}")
     resp_json = resp.json()
     tgt = ""
@@ -77,6 +88,39 @@ def translate(data: str):
     return tgt
 
 
+def chunk(texts: list[str]) -> list[list[int]]:
+    return chunk_texts(texts, BATCH_CHARS, sep_len=len(BLOCK_DELIM))
+
+
+def _translate_packed(texts: list[str]) -> list[str] | None:
+    if all("\n" not in text for text in texts):
+        tgt = translate(LINE_DELIM.join(texts))
+        pieces = [piece for piece in tgt.split("\n") if len(piece.strip()) != 0]
+    else:
+        tgt = translate(BLOCK_DELIM.join(texts))
+        pieces = _BLOCK_SPLIT.split(tgt.strip())
+    if len(pieces) != len(texts):
+        return None
+    return [piece.strip() for piece in pieces]
+
+
+def translate_many(texts: list[str]) -> list[str] | None:
+    # one request per chunk. None if the delimiters got mangled and we cannot tell which piece is which,
+    # the caller then translates the texts one by one under its rate limit
+    results = list()
+    for idx in chunk(texts):
+        part = [texts[i] for i in idx]
+        if len(part) == 1:
+            results.append(translate(part[0]))
+            continue
+        pieces = _translate_packed(part)
+        if pieces is None:
+            return None
+        results += pieces
+    return results
+
+
 if __name__ == "__main__":
     print("Test:")
     print(translate("What are you doing now?"))
+    print(translate_many(["What are you doing now?", "A new method for sparse attention"]))
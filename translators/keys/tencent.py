@@ -0,0 +1,2 @@
+SecretId = "x"
+SecretKey = "x"
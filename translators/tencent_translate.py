@@ -1,3 +1,4 @@
+import functools
 import json
 
 from tencentcloud.common import credential
@@ -7,25 +8,36 @@ from tencentcloud.common.profile.client_profile import ClientProfile
 from tencentcloud.common.profile.http_profile import HttpProfile
 from tencentcloud.tmt.v20180321 import models, tmt_client
 
+from .batching import chunk_texts
 from .keys.tencent import SecretId, SecretKey
 from utils import logger
 
+# TextTranslateBatch: total length of SourceTextList must stay below 6000 chars
+BATCH_CHARS = 6000
+
+
+@functools.cache
+def get_client() -> tmt_client.TmtClient:
+    # 实例化一个认证对象，入参需要传入腾讯云账户 SecretId 和 SecretKey，此处还需注意密钥对的保密
+    # 代码泄露可能会导致 SecretId 和 SecretKey 泄露，并威胁账号下所有资源的安全性。以下代码示例仅供参考，建议采用更安全的方式来使用密钥，请参见：https://cloud.tencent.com/document/product/1278/85305
+    # 密钥可前往官网控制台 https://console.cloud.tencent.com/cam/capi 进行获取
+    cred = credential.Credential(SecretId, SecretKey)
+    # 实例化一个http选项，可选的，没有特殊需求可以跳过
+    httpProfile = HttpProfile()
+    httpProfile.endpoint = "tmt.tencentcloudapi.com"
+    httpProfile.keepAlive = True
+
+    # 实例化一个client选项，可选的，没有特殊需求可以跳过
+    clientProfile = ClientProfile()
+    clientProfile.httpProfile = httpProfile
+    # 实例化要请求产品的client对象,clientProfile是可选的
+    logger.debug("creating tencent TmtClient")
+    return tmt_client.TmtClient(cred, "ap-beijing", clientProfile)
+
 
 def translate(src_text: str) -> str | None:
     try:
-        # 实例化一个认证对象，入参需要传入腾讯云账户 SecretId 和 SecretKey，此处还需注意密钥对的保密
-        # 代码泄露可能会导致 SecretId 和 SecretKey 泄露，并威胁账号下所有资源的安全性。以下代码示例仅供参考，建议采用更安全的方式来使用密钥，请参见：https://cloud.tencent.com/document/product/1278/85305
-        # 密钥可前往官网控制台 https://console.cloud.tencent.com/cam/capi 进行获取
-        cred = credential.Credential(SecretId, SecretKey)
-        # 实例化一个http选项，可选的，没有特殊需求可以跳过
-        httpProfile = HttpProfile()
-        httpProfile.endpoint = "tmt.tencentcloudapi.com"
-
-        # 实例化一个client选项，可选的，没有特殊需求可以跳过
-        clientProfile = ClientProfile()
-        clientProfile.httpProfile = httpProfile
-        # 实例化要请求产品的client对象,clientProfile是可选的
-        client = tmt_client.TmtClient(cred, "ap-beijing", clientProfile)
+        client = get_client()
 
         # 实例化一个请求对象,每个接口都会对应一个request对象
         req = models.TextTranslateRequest()
@@ -49,6 +61,35 @@ def translate(src_text: str) -> str | None:
         return None
 
 
+def chunk(src_texts: list[str]) -> list[list[int]]:
+    return chunk_texts(src_texts, BATCH_CHARS - 1)
+
+
+def translate_many(src_texts: list[str]) -> list[str | None]:
+    results = list()
+    for idx in chunk(src_texts):
+        part = [src_texts[i] for i in idx]
+        try:
+            client = get_client()
+            req = models.TextTranslateBatchRequest()
+            params = {
+                "SourceTextList": part,
+                "Source": "en",
+                "Target": "zh",
+                "ProjectId": 0
+            }
+            req.from_json_string(json.dumps(params))
+
+            resp = client.TextTranslateBatch(req)
+            logger.debug(resp.to_json_string())
+            result = json.loads(resp.to_json_string())
+            results += result["TargetTextList"]
+        except TencentCloudSDKException as err:
+            logger.critical(err)
+            results += [None] * len(part)
+    return results
+
+
 if __name__ == "__main__":
     res = translate("The ability to learn reward functions plays an important role in enabling the deployment of intelligent agents in the real world. However, reward functions, for example as a means of evaluating reward learning methods, presents a challenge. Reward functions are typically compared by considering the behavior of optimized policies, but this approach conflates deficiencies in the reward function with those of the policy search algorithm used to optimize it. To address this challenge, Gleave et al. (2020) propose the Equivalent-Policy Invariant Comparison (EPIC) distance. EPIC avoids policy optimization, but in doing so requires computing reward values at transitions that may be impossible under the system dynamics. This is problematic for learned reward functions because it entails evaluating them outside of their training distribution, resulting in inaccurate reward values that we show can render EPIC ineffective at comparing rewards. To address this problem, we propose the Dynamics-Aware Reward Distance (DARD), a new reward pseudometric. DARD uses an approximate transition model of the environment to transform reward functions into a form that allows for comparisons that are invariant to reward shaping while only evaluating reward functions on transitions close to their training distribution. Experiments in simulated physical domains demonstrate that DARD enables reliable reward comparisons without policy optimization and is significantly more predictive than baseline methods of downstream policy performance when dealing with learned reward functions.")
     print(res)
@@ -1,13 +1,17 @@
 import datetime
 import logging
 import pickle
+import queue
 import re
+import threading
+import time
+from typing import Iterable, Iterator, TypeVar
 
 import pytz
 
 _local_tz = pytz.timezone("Asia/Shanghai")
 _utc_tz = pytz.timezone("UTC")
-_arxiv_tz = pytz.timezone("EST")
+_arxiv_tz = pytz.timezone("America/New_York")
 
 
 def parse_time(time_str: str) -> datetime.datetime:
@@ -37,15 +41,29 @@ def get_arxiv_time(raw_datetime: datetime.datetime | str) -> datetime.datetime:
     return raw_datetime.astimezone(_arxiv_tz)
 
 
+def get_arxiv_day(raw_datetime: datetime.datetime | datetime.date | str) -> str:
+    # daily key of an announcement: midnight of its date in arxiv's timezone, so the RSS pubDate
+    # and a backfilled date give the same key whether or not daylight saving is in effect
+    if isinstance(raw_datetime, (str, datetime.datetime)):
+        raw_datetime = get_arxiv_time(raw_datetime).date()
+    return _arxiv_tz.localize(datetime.datetime.combine(raw_datetime, datetime.time())).isoformat()
+
+
+# bump NORMALIZE_VERSION whenever the rules below change, stored papers get re-normalized
+NORMALIZE_VERSION = 1
+_re_latex_times = re.compile(r"\$\s*\\times\s*\$")
+_re_latex_math = re.compile(r"\$.*\$")
+_re_latex_escape = re.compile(r"\\([&%\$#_\{\}])")
+_re_whitespace = re.compile(r"\s+")
+
+
 def pre_process_latex(raw_text: str) -> str:
     text = raw_text
-    text = re.sub(r"\$\s*\\times\s*\$", "times", text)
+    text = _re_latex_times.sub("times", text)
     # a common pattern in arXiv abs: ... outperforms the SOTA by 2.56 $\times$
-    if re.match(re.compile(r"\$.*\$"), text) is not None:
-        logger.warn("Unsupported math notation!")
-    else:
-        logger.error(re.match(re.compile(r"\$.*\$"), text))
-    text = re.sub(r"\\([&%\$#_\{\}])", r"\1", text)
+    if _re_latex_math.match(text) is not None:
+        logger.warning("Unsupported math notation!")
+    text = _re_latex_escape.sub(r"\1", text)
     # The following 10 characters have special meanings in (La)TeX:
     # & % $ # _ { } ~ ^ \
     # ==>
@@ -68,7 +86,7 @@ def pre_process_abstract(raw_text: str) -> str:
 
 
 def pre_proc_title(raw_title: str) -> str:
-    return re.sub(r"\s+", " ", raw_title)
+    return _re_whitespace.sub(" ", raw_title)
 
 
 def pkl_load(obj_path):
@@ -82,6 +100,70 @@ def pkl_dump(obj, obj_path):
         pickle.dump(obj, pkl_file)
 
 
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `capacity` banked."""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens: float = 1):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+T = TypeVar("T")
+_PREFETCH_END = object()
+
+
+def prefetch(iterable: Iterable[T], depth: int = 2) -> Iterator[T]:
+    """Drive `iterable` on a background thread, keeping at most `depth` items buffered."""
+    buffer: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def producer():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        buffer.put((item, None), timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+            buffer.put((_PREFETCH_END, None))
+        except BaseException as err:
+            buffer.put((_PREFETCH_END, err))
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, err = buffer.get()
+            if item is _PREFETCH_END:
+                if err is not None:
+                    raise err
+                return
+            yield item
+    finally:
+        stop.set()
+
+
 logger = logging.getLogger("arxiv-feed")
 
 
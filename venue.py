@@ -0,0 +1,126 @@
+import csv
+import functools
+import hashlib
+import os.path as path
+import re
+from dataclasses import dataclass
+
+from config import VENUE_MATCH_ABSTRACT
+
+CCF_CONF_PATH = path.join(path.dirname(path.abspath(__file__)), "CCF-Conf.csv")
+# bump when the matching rules change, stored venues are then recomputed by `db.reannotate_db`
+MATCHER_VERSION = 2
+RANK_ORDER = {"A": 0, "B": 1, "C": 2}
+URL_PATTERN = re.compile(r"(?:https?://|www\.)\S+|\S+\.(?:com|org|net|io|edu)(?:/\S*)?", re.IGNORECASE)
+CLAUSE_END = re.compile(r"[;\n]|\.\s")
+# in the clause before a venue: says the paper is in it
+ACCEPT_CUE = re.compile(r"\b(?:accepted|appears?|appeared|appearing|published|presented)\b", re.IGNORECASE)
+# in the clause before a venue: not (yet) in its main track
+REJECT_BEFORE = re.compile(r"\b(?:submitted|submission|under\s+review|findings|workshops?)\b", re.IGNORECASE)
+# in the clause after a venue
+REJECT_AFTER = re.compile(r"\b(?:workshops?|findings)\b", re.IGNORECASE)
+
+
+@dataclass(slots=True, frozen=True)
+class Venue:
+    acronym: str
+    name: str
+    rank: str
+    kind: str
+    field: str
+
+    @property
+    def label(self) -> str:
+        return self.acronym or self.name
+
+
+@dataclass(slots=True)
+class VenueMatcher:
+    pattern: re.Pattern
+    by_acronym: dict[str, Venue]
+    by_name: dict[str, Venue]
+    version: str
+
+
+def _load_venues() -> tuple[list[Venue], bytes]:
+    with open(CCF_CONF_PATH, "rb") as f:
+        raw = f.read()
+    rows = list(csv.reader(raw.decode("utf-8-sig").splitlines()))[1:]
+    venues = [Venue(row[1].strip(), " ".join(row[2].split()), row[3].strip(), row[4].strip(), row[5].strip())
+              for row in rows if len(row) >= 6]
+    return venues, raw
+
+
+@functools.cache
+def get_matcher() -> VenueMatcher:
+    # every venue in one alternation, longest first so that a longer name wins over its own prefix.
+    # full names match case-insensitively, acronyms only as written
+    venues, raw = _load_venues()
+    by_acronym: dict[str, Venue] = dict()
+    by_name: dict[str, Venue] = dict()
+    for venue in venues:
+        # an acronym shared by a conference and a journal is, in a comment, almost always the conference
+        if venue.acronym and (venue.acronym not in by_acronym or
+                              (by_acronym[venue.acronym].kind != "会议" and venue.kind == "会议")):
+            by_acronym[venue.acronym] = venue
+        if venue.name:
+            by_name.setdefault(venue.name.lower(), venue)
+    names = "|".join(r"\s+".join(map(re.escape, name.split())) for name in sorted(by_name, key=len, reverse=True))
+    acronyms = "|".join(re.escape(acronym) for acronym in sorted(by_acronym, key=len, reverse=True))
+    pattern = re.compile(rf"(?<![\w&])(?:(?P<full>(?i:{names}))|(?P<acr>{acronyms})"
+                         rf"(?P<year>\s?'\d{{2}}|,?\s?(?:19|20)\d{{2}}|\d{{2}})?)(?![\w&])")
+    version = f"{hashlib.sha1(raw).hexdigest()[:12]}.{MATCHER_VERSION}{'+abs' if VENUE_MATCH_ABSTRACT else ''}"
+    return VenueMatcher(pattern, by_acronym, by_name, version)
+
+
+def version() -> str:
+    return get_matcher().version
+
+
+def _clause(text: str, start: int, end: int) -> tuple[str, str]:
+    # text of the clause around text[start:end], before and after it
+    before = text[:start]
+    clause_start = max((found.end() for found in CLAUSE_END.finditer(before)), default=0)
+    after = text[end:]
+    clause_end = CLAUSE_END.search(after)
+    return before[clause_start:], after if clause_end is None else after[:clause_end.start()]
+
+
+def match(text: str | None, need_year: bool = False) -> Venue | None:
+    # first venue the paper is in according to `text`. an acronym needs a year next to it or an
+    # "accepted at"-like cue earlier in its clause (always a year if `need_year` or one or two letters).
+    # venues in urls, or whose clause says submitted, under review, workshop or findings, are skipped
+    if not text:
+        return None
+    matcher = get_matcher()
+    urls = [found.span() for found in URL_PATTERN.finditer(text)]
+    for found in matcher.pattern.finditer(text):
+        if any(url_start <= found.start() < url_end for url_start, url_end in urls):
+            continue
+        before, after = _clause(text, found.start(), found.end())
+        if REJECT_BEFORE.search(before) or REJECT_AFTER.search(after):
+            continue
+        if found.group("full") is not None:
+            return matcher.by_name[" ".join(found.group("full").split()).lower()]
+        acronym = found.group("acr")
+        if found.group("year") is None and (need_year or len(acronym) <= 2 or not ACCEPT_CUE.search(before)):
+            continue
+        return matcher.by_acronym[acronym]
+    return None
+
+
+def annotate(comment: str | None, abstract: str | None) -> Venue | None:
+    venue = match(comment)
+    if venue is None and VENUE_MATCH_ABSTRACT:
+        venue = match(abstract, need_year=True)
+    return venue
+
+
+def rank_key(rank: str | None) -> int:
+    return RANK_ORDER.get(rank, len(RANK_ORDER))
+
+
+if __name__ == "__main__":
+    import sys
+    for line in sys.argv[1:]:
+        print(line, "->", match(line))
@@ -0,0 +1,128 @@
+import functools
+import hashlib
+import os
+import re
+import sys
+from dataclasses import dataclass
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
+
+from arxivdata import ATOMItem
+from utils import logger
+
+# a hit in the title counts this many times its weight
+TITLE_BOOST = 2.0
+AUTHOR_SEP = "; "
+
+
+@dataclass(slots=True)
+class Watchlist:
+    pattern: re.Pattern
+    keywords: dict[str, float]
+    authors: dict[str, float]
+    version: str
+
+
+def _trie_pattern(terms: list[str]) -> str:
+    # prefix-factored alternation: at each position the regex engine walks one trie path
+    # instead of trying thousands of alternatives in turn
+    trie: dict = dict()
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, dict())
+        node[""] = True
+
+    def build(node: dict) -> str:
+        branches = [(r"\s+" if char == " " else re.escape(char)) + build(child)
+                    for char, child in sorted(node.items()) if char != ""]
+        if len(branches) == 0:
+            return ""
+        optional = "" in node
+        if len(branches) == 1 and not optional:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if optional else group
+
+    return build(trie)
+
+
+def _term(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def load(watchlist_path: str) -> Watchlist | None:
+    # parsed again only when the file changes, so long running `serve` and `daemon` pick up edits
+    try:
+        stat = os.stat(watchlist_path)
+    except FileNotFoundError:
+        return None
+    return _load(watchlist_path, stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=4)
+def _load(watchlist_path: str, mtime_ns: int, size: int) -> Watchlist | None:
+    # ```toml
+    # [keywords]
+    # "serverless" = 3
+    # "large language model" = 2
+    # [authors]
+    # "Ion Stoica" = 5
+    # ```
+    with open(watchlist_path, "rb") as f:
+        raw = f.read()
+    config = tomllib.loads(raw.decode("utf-8"))
+    keywords = {_term(term): float(weight) for term, weight in config.get("keywords", {}).items()}
+    authors = {_term(term): float(weight) for term, weight in config.get("authors", {}).items()}
+    terms = sorted(set(keywords) | set(authors))
+    if len(terms) == 0:
+        return None
+    pattern = re.compile(rf"(?<!\w)(?:{_trie_pattern(terms)})(?!\w)", re.IGNORECASE)
+    logger.info(f"watchlist: {len(keywords)} keywords, {len(authors)} authors")
+    return Watchlist(pattern, keywords, authors, hashlib.sha1(raw).hexdigest()[:12])
+
+
+def score(watchlist: Watchlist, atom_item: ATOMItem) -> tuple[float, tuple[str, ...]]:
+    # one scan over title, abstract and authors; keywords only count in the text, authors only in the author list
+    title = atom_item.title_clean or atom_item.title or ""
+    summary = atom_item.summary_clean or atom_item.summary or ""
+    text = f"{title}\n{summary}\n{AUTHOR_SEP.join(atom_item.author)}"
+    summary_start = len(title) + 1
+    author_start = summary_start + len(summary) + 1
+    weights: dict[str, float] = dict()
+    for found in watchlist.pattern.finditer(text):
+        term = _term(found.group())
+        if found.start() >= author_start:
+            weight = watchlist.authors.get(term)
+        else:
+            weight = watchlist.keywords.get(term)
+            if weight is not None and found.start() < summary_start:
+                weight *= TITLE_BOOST
+        if weight is not None:
+            weights[term] = max(weights.get(term, 0.0), weight)
+    hits = tuple(sorted(weights, key=lambda term: -weights[term]))
+    return sum(weights.values()), hits
+
+
+def score_items(watchlist: Watchlist, atom_items: list[ATOMItem]):
+    for atom_item in atom_items:
+        atom_item.relevance, atom_item.watch_hits = score(watchlist, atom_item)
+
+
+def highlight(watchlist: Watchlist | None, text: str, mark, escape) -> str:
+    # `escape` applied to plain text, `mark` to the matched keywords
+    if watchlist is None or not text:
+        return escape(text)
+    parts = []
+    last = 0
+    for found in watchlist.pattern.finditer(text):
+        if _term(found.group()) not in watchlist.keywords:
+            continue
+        parts.append(escape(text[last:found.start()]))
+        parts.append(mark(found.group()))
+        last = found.end()
+    parts.append(escape(text[last:]))
+    return "".join(parts)